@@ -1,25 +1,48 @@
 import streamlit as st
 import pandas as pd
 import plotly.express as px
+import os
+import uuid
 
 # Import our modules
-from config.sqlite_config import get_sqlite_connection
-from config.snowflake_config import get_snowflake_connection
-from scripts import data_fetcher, comparator, quality_checks
+from config import connection_pool
+from scripts import data_fetcher, comparator, profiler, results_store, sketches, executor, instrumentation, result_cache, partitioned, rules, reconcile, precompute, drilldown
 
 # Title and description
 st.title("Data Quality Check App")
 st.markdown("This demo app compares table data between the source (SQLite) and target (Snowflake) databases.")
 
-# Get connections
-conn_sqlite = get_sqlite_connection()
-
-# For Snowflake, wrap in try/except to handle missing credentials in demo mode.
-try:
-    conn_snowflake = get_snowflake_connection()
-except Exception as e:
+# Tag every instrumented call of this rerun so the Performance panel shows only its own
+run_id = uuid.uuid4().hex
+instrumentation.set_tags(run=run_id)
+
+# Queries run on the shared executor, each on a pooled connection, so the
+# source and target sides of every step run at the same time.
+# A side is a (pool name, source type) pair.
+compare = executor.get_executor()
+SOURCE = ('sqlite', 'sqlite')
+
+# Checks of every common table are refreshed in the background and read from a local snapshot.
+# While it is fresh, table lists, row counts and versions come from it instead of the databases;
+# "Refresh metadata" (its state is known before the button is drawn) goes live for one rerun.
+scheduler = precompute.get_scheduler() if os.environ.get("DQ_PRECOMPUTE", "1") == "1" else None
+snapshot = precompute.read_snapshot()
+refresh = st.session_state.get('refresh_metadata', False)
+
+if not refresh and precompute.is_fresh(snapshot):
+    # The snapshot was taken with whichever target was reachable, so there is no need to probe it
+    TARGET = (snapshot['target']['source_type'],) * 2
+else:
+    # For Snowflake, wrap in try/except to handle missing credentials in demo mode.
+    try:
+        with connection_pool.get_pool('snowflake').connection():
+            TARGET = ('snowflake', 'snowflake')
+    except Exception as e:
+        TARGET = ('sqlite', 'sqlite')  # For demo purposes
+if TARGET[1] == 'sqlite':
     st.warning("Snowflake connection not configured. Using SQLite as a placeholder for Snowflake data.")
-    conn_snowflake = get_sqlite_connection()  # For demo purposes
+target_source = TARGET[1]
+MISMATCH_PAGE_SIZE = 50
 
 
 # Sidebar: Select table to compare
@@ -29,17 +52,38 @@ with st.sidebar:
 
     st.sidebar.markdown("## 🔍 Schema Selection")
 
+    # Schemas, table lists and column definitions are cached between reruns
+    if st.sidebar.button("🔄 Refresh metadata", key='refresh_metadata'):
+        data_fetcher.metadata_cache.invalidate()
+
     # sqlite_schemas = ['main']  # SQLite doesn't really use schemas like Snowflake, but keep it uniform
-    snowflake_schemas = data_fetcher.get_snowflake_schemas(conn_snowflake)
-    snowflake_schemas.remove('INFORMATION_SCHEMA')
+    if target_source == 'snowflake':
+        snowflake_schemas = compare.submit(TARGET[0], data_fetcher.get_snowflake_schemas).result()
+        snowflake_schemas.remove('INFORMATION_SCHEMA')
+    else:
+        snowflake_schemas = ['MAIN']
 
     # selected_sqlite_schema = st.sidebar.selectbox("SQLite Schema", sqlite_schemas)
-    selected_snowflake_schema = st.sidebar.selectbox("Schema", snowflake_schemas)
+    # Start on the schema the snapshot was taken for, so it can be served from
+    snapshot_schema = (snapshot or {}).get('schema', '').upper()
+    selected_snowflake_schema = st.sidebar.selectbox(
+        "Schema", snowflake_schemas,
+        index=snowflake_schemas.index(snapshot_schema) if snapshot_schema in snowflake_schemas else 0)
 
     # Get table lists
-    # Fetch table names
-    tables_sqlite = data_fetcher.get_table_list(conn_sqlite, source='sqlite')
-    tables_snowflake = data_fetcher.get_table_list(conn_snowflake, source='snowflake', schema=selected_snowflake_schema)
+    snapshot_fresh = precompute.is_fresh(snapshot, schema=selected_snowflake_schema)
+    use_snapshot = not refresh and snapshot_fresh
+    if use_snapshot:
+        tables_sqlite = list(snapshot['source']['tables'])
+        tables_snowflake = list(snapshot['target']['tables'])
+    else:
+        # Fetch every table's column definitions, row count and version with one query per side, all at once
+        schema_futures = compare.submit_pair(data_fetcher.get_all_table_schemas, SOURCE, TARGET, schema=selected_snowflake_schema)
+        row_count_futures = compare.submit_pair(data_fetcher.get_all_row_counts, SOURCE, TARGET, schema=selected_snowflake_schema)
+        version_futures = compare.submit_pair(data_fetcher.get_table_versions, SOURCE, TARGET, schema=selected_snowflake_schema)
+        schemas_sqlite, schemas_snowflake = executor.results(*schema_futures)
+        tables_sqlite = list(schemas_sqlite)
+        tables_snowflake = list(schemas_snowflake)
 
     tables_sqlite = [sq.capitalize() for sq in tables_sqlite]
     tables_sqlite.append("Activity")
@@ -51,6 +95,39 @@ with st.sidebar:
 
     selected_table = st.sidebar.selectbox("Select a Table", tables_sqlite)
 
+    # Heavy sections only query and compute when switched on
+    st.sidebar.markdown("## 📂 Sections")
+    show_fingerprints = st.sidebar.toggle("Column fingerprints")
+    show_samples = st.sidebar.toggle("Sample data")
+    show_quality = st.sidebar.toggle("Data quality checks")
+    show_summary = st.sidebar.toggle("Summary report")
+    show_rules = st.sidebar.toggle("Validation rules")
+    show_foreign_keys = st.sidebar.toggle("Referential integrity")
+    # Profile SQLite tables with one worker process per key-range partition
+    parallel_profile = st.sidebar.toggle("Parallel profiling")
+
+    st.sidebar.markdown("## 🗂️ Precomputed Checks")
+    if snapshot_fresh:
+        st.sidebar.caption(f"Snapshot is {precompute.snapshot_age(snapshot) / 60:.0f} min old "
+                           f"(took {snapshot['seconds']:.0f} s)")
+    elif snapshot:
+        st.sidebar.caption(f"Snapshot is out of date or for schema {snapshot['schema'] or 'MAIN'}.")
+    else:
+        st.sidebar.caption("No snapshot yet.")
+    if scheduler:
+        if scheduler.running:
+            st.sidebar.caption("Recomputing...")
+        elif st.sidebar.button("Recompute now"):
+            scheduler.trigger()
+        if scheduler.last_error:
+            st.sidebar.caption(f"Last recompute failed: {scheduler.last_error}")
+
+    cache_stats = data_fetcher.metadata_cache.stats()
+    st.sidebar.caption(f"Metadata cache: {cache_stats['hits']} hits, {cache_stats['misses']} misses")
+    for backend, stats in connection_pool.pool_stats().items():
+        st.sidebar.caption(f"{backend} pool: {stats['created']} connections created, "
+                           f"{stats['wait_time_max'] * 1000:.0f} ms max wait")
+
 
 st.markdown("---") 
 
@@ -73,15 +150,80 @@ with col2:
     st.markdown("#### ❌ Tables only in Snowflake")
     st.write(snowflake_only)
 
+# Row counts of every table, one query per side
+if use_snapshot:
+    row_counts_sqlite, row_counts_snowflake = snapshot['source']['row_counts'], snapshot['target']['row_counts']
+else:
+    row_counts_sqlite, row_counts_snowflake = executor.results(*row_count_futures)
+row_counts_df = pd.DataFrame({
+    "Table": sorted(common_tables),
+    "SQLite Rows": [row_counts_sqlite.get(t.lower()) for t in sorted(common_tables)],
+    "Snowflake Rows": [row_counts_snowflake.get(t.lower()) for t in sorted(common_tables)],
+})
+st.markdown("#### 🔢 Row Counts (all common tables)")
+st.dataframe(row_counts_df, use_container_width=True)
+
+# Status of every common table from the background snapshot, no source/target queries
+if snapshot_fresh and snapshot['tables']:
+    st.markdown("#### 🗂️ Precomputed Check Status (all common tables)")
+    snapshot_df = pd.DataFrame(list(snapshot['tables'].values()))
+    snapshot_df['failed_checks'] = snapshot_df['failed_checks'].str.join(', ')
+    st.dataframe(snapshot_df[[c for c in ('table', 'status', 'failed_checks', 'row_count_source', 'row_count_target',
+                                          'duplicates_source', 'duplicates_target', 'error') if c in snapshot_df]],
+                 use_container_width=True)
+
 st.markdown("---") 
 
 if tables_sqlite and selected_table in tables_snowflake:
 
     st.header(f"Comparison for Table: **{selected_table}**")
 
+    # Results are memoized per table version, so reruns that don't change the data reuse them
+    if use_snapshot:
+        versions_sqlite, versions_snowflake = snapshot['source']['versions'], snapshot['target']['versions']
+    else:
+        versions_sqlite, versions_snowflake = executor.results(*version_futures)
+    versions = {
+        SOURCE: versions_sqlite.get(selected_table.lower()),
+        TARGET: versions_snowflake.get(selected_table.lower()),
+    }
+
+    def submit_check(check, fn, *args, **kwargs):
+        # (source future, target future) of a memoized check of the selected table
+        return tuple(
+            compare.submit(side[0], result_cache.cached_check, check, fn, selected_table, *args,
+                           source=side[1], version=versions[side], **kwargs)
+            for side in (SOURCE, TARGET)
+        )
+
+    # Start every shown step for this table on both sides before rendering any of them
+    sample_key = compare.submit(SOURCE[0], data_fetcher.get_primary_key, selected_table, source=SOURCE[1]).result()
+    sample_rate = min(1.0, 120 / max(row_counts_sqlite[selected_table.lower()], 1))
+    if show_fingerprints:
+        fingerprint_futures = submit_check('fingerprints', comparator.column_fingerprints)
+    if show_samples:
+        sample_futures = submit_check('key_sample', data_fetcher.get_key_sample, sample_key, sample_rate)
+    if show_rules:
+        # Editing the rule file gives the results a new cache key
+        rules_check = f"rules:{os.path.getmtime(rules.DEFAULT_RULES_PATH)}"
+        rules_futures = submit_check(rules_check, rules.validate_table, rules=None, mode='sql', sample_keys=10)
+    if show_foreign_keys:
+        # Foreign keys declared in the source are checked on both sides, since Snowflake rarely declares them
+        foreign_keys = compare.submit(SOURCE[0], reconcile.get_foreign_keys, source=SOURCE[1]).result()
+        foreign_key_futures = tuple(
+            compare.submit(side[0], reconcile.check_foreign_keys, source=side[1],
+                           foreign_keys=foreign_keys, table_name=selected_table)
+            for side in (SOURCE, TARGET)
+        )
+    if show_quality or show_summary:
+        if parallel_profile:
+            profile_futures = submit_check('profile_partitioned', partitioned.profile_table)
+        else:
+            profile_futures = submit_check('profile', profiler.profile_table)
+
     # Row counts
-    row_count_source = data_fetcher.get_table_row_count(conn_sqlite, selected_table, source='sqlite')
-    row_count_target = data_fetcher.get_table_row_count(conn_snowflake, selected_table, source='snowflake')
+    row_count_source = row_counts_sqlite[selected_table.lower()]
+    row_count_target = row_counts_snowflake[selected_table.lower()]
     match, count_source, count_target = comparator.compare_row_counts(row_count_source, row_count_target)
 
     st.subheader("Row Count Comparison")
@@ -101,12 +243,21 @@ if tables_sqlite and selected_table in tables_snowflake:
     fig = px.bar(df_counts, x='Database', y='Rows', color='Database', title="Row Count Comparison")
     st.plotly_chart(fig)
 
-    st.markdown("---") 
+    st.markdown("---")
 
     # Schema Comparison
     st.subheader("Schema Comparison")
-    schema_source = data_fetcher.get_table_schema(conn_sqlite, selected_table, source='sqlite')
-    schema_target = data_fetcher.get_table_schema(conn_snowflake, selected_table, source='snowflake')
+    if use_snapshot:
+        # Only the shown table's columns, from the metadata cache after the first look
+        schema_source, schema_target = executor.results(
+            *compare.submit_pair(data_fetcher.get_table_schema, SOURCE, TARGET, selected_table,
+                                 schema=selected_snowflake_schema)
+        )
+    else:
+        schema_source = schemas_sqlite[selected_table.lower()]
+        schema_target = schemas_snowflake[selected_table.lower()]
+    if target_source == 'sqlite':
+        schema_target = schema_target.rename(columns={'name': 'COLUMN_NAME', 'type': 'DATA_TYPE'})
 
     if schema_source['name'].count() == schema_target['COLUMN_NAME'].count():
         st.success("Column counts match!")
@@ -119,103 +270,252 @@ if tables_sqlite and selected_table in tables_snowflake:
     st.markdown("**Target Schema (Snowflake):**")
     st.dataframe(schema_target[['COLUMN_NAME','DATA_TYPE']])
 
+    # Column fingerprints: a few aggregates per column, computed in one pass on each side
+    drifted = []
+    if show_fingerprints:
+        st.subheader("Column Fingerprint Comparison")
+        fingerprints = comparator.compare_fingerprints(*executor.results(*fingerprint_futures))
+        drifted = comparator.drifted_columns(fingerprints)
+        if drifted:
+            st.error(f"Columns with drifted values: {', '.join(drifted)}")
+        else:
+            st.success("All column fingerprints match!")
+        st.dataframe(fingerprints, use_container_width=True)
+
+    # Row-level diff (only on demand), hashing only the drifted columns when there are any
+    if st.button("Find changed rows"):
+        with connection_pool.get_pool(SOURCE[0]).connection() as conn_source, \
+                connection_pool.get_pool(TARGET[0]).connection() as conn_target:
+            diff = comparator.diff_tables(conn_source, conn_target, selected_table, sample_key,
+                                          source=SOURCE[1], target=TARGET[1], columns=drifted or None)
+        # Only the mismatched keys are kept between reruns; their rows are fetched a page at a time
+        st.session_state['mismatches'] = {'table': selected_table, 'keys': drilldown.mismatch_keys(diff)}
+        st.dataframe(comparator.diff_summary(diff), use_container_width=True)
+        one_sided = diff['source_only_columns'] + diff['target_only_columns']
+        if one_sided:
+            st.warning(f"Not compared, present on one side only: {', '.join(one_sided)}")
+
+    mismatches = st.session_state.get('mismatches')
+    if mismatches and mismatches['table'] == selected_table:
+        st.markdown("#### 🔎 Mismatched Rows")
+        kind = st.selectbox("Difference", drilldown.DIFF_KINDS)
+        keys = mismatches['keys'][kind]
+        # Last key of every page before the current one (None for the first page)
+        pages = st.session_state.setdefault(f"mismatch_pages:{selected_table}:{kind}", [None])
+        col1, col2 = st.columns(2)
+        if col1.button("◀ Previous page") and len(pages) > 1:
+            pages.pop()
+        if col2.button("Next page ▶"):
+            page_keys = drilldown.next_page(keys, pages[-1], MISMATCH_PAGE_SIZE)
+            if len(page_keys) and len(drilldown.next_page(keys, page_keys[-1], 1)):
+                pages.append(page_keys[-1])
+        page_keys = drilldown.next_page(keys, pages[-1], MISMATCH_PAGE_SIZE)
+        st.caption(f"Page {len(pages)} of {max(1, -(-len(keys) // MISMATCH_PAGE_SIZE))} ({len(keys)} {kind} {sample_key}s)")
+        if len(page_keys):
+            with connection_pool.get_pool(SOURCE[0]).connection() as conn_source, \
+                    connection_pool.get_pool(TARGET[0]).connection() as conn_target:
+                st.dataframe(drilldown.page_rows(conn_source, conn_target, selected_table, sample_key, page_keys,
+                                                 kind, source=SOURCE[1], target=TARGET[1]),
+                             use_container_width=True)
+
+        # Exports are written to disk a chunk at a time, next to the app
+        export_format = st.selectbox("Export format", ['parquet', 'csv'])
+        if st.button("Export mismatched rows"):
+            path = os.path.join(drilldown.DEFAULT_EXPORT_DIR, f"{selected_table.lower()}_mismatches.{export_format}")
+            with connection_pool.get_pool(SOURCE[0]).connection() as conn_source, \
+                    connection_pool.get_pool(TARGET[0]).connection() as conn_target:
+                written = drilldown.export_mismatches(conn_source, conn_target, selected_table, sample_key,
+                                                      mismatches['keys'], path, source=SOURCE[1], target=TARGET[1])
+            st.success(f"Wrote {written} rows to {os.path.abspath(path)}")
+
+
+    # Keys missing on either side, merge-joined from both sorted key columns with constant memory
+    if st.button("Reconcile keys"):
+        with connection_pool.get_pool(SOURCE[0]).connection() as conn_source, \
+                connection_pool.get_pool(TARGET[0]).connection() as conn_target:
+            keys = reconcile.reconcile_keys(conn_source, conn_target, selected_table, sample_key,
+                                            source=SOURCE[1], target=TARGET[1])
+        if keys['missing_in_target'] or keys['extra_in_target']:
+            st.error(f"{keys['missing_in_target']} {sample_key}s missing in target, "
+                     f"{keys['extra_in_target']} only in target.")
+        else:
+            st.success(f"All {keys['source_keys']} {sample_key}s are present on both sides.")
+        for kind in ('missing_in_target', 'extra_in_target'):
+            if keys[kind]:
+                st.write(f"**{kind.replace('_', ' ').capitalize()} (sample):** {keys[kind + '_sample']}")
+
+    if show_samples:
+        st.markdown("---") 
 
-    st.markdown("---") 
-
-    # Sample Data Comparison
-    st.subheader("Sample Data Comparison")
-    sample_source = data_fetcher.get_sample_data(conn_sqlite, selected_table, n=120, source='sqlite')
-    sample_target = data_fetcher.get_sample_data(conn_snowflake, selected_table, n=120, source='snowflake')
-
-    st.markdown("**Source Sample Data (SQLite):**")
-    st.dataframe(sample_source)
-
-    st.markdown("**Target Sample Data (Snowflake):**")
-    st.dataframe(sample_target)
-
-    col1, col2 = st.columns(2)
-
-    with col1:
-        st.markdown("**Duplicate Row Count (SQLite):**")
-        duplicates_sqlite = quality_checks.check_duplicates(sample_source)
-        st.write(duplicates_sqlite)
-
-    with col2:
-        st.markdown("**Duplicate Row Count (Snowflake):**")
-        duplicates_snowflake = quality_checks.check_duplicates(sample_target)
-        st.write(duplicates_snowflake)
-
-    st.markdown("---") 
-
-    # Data Quality Checks on source
-    st.subheader("Data Quality Checks (Source)")
-    st.markdown("**Null Value Percentage per Column (SQLite):**")
-    nulls = quality_checks.check_nulls(sample_source)
-    nulls_df = nulls.reset_index()
-    nulls_df.columns = ['Column Name', 'Percentage (%)']
-    st.dataframe(nulls_df, use_container_width=True)
-
-    st.markdown("**Null Value Percentage per Column (Snowflake):**")
-    nulls = quality_checks.check_nulls(sample_target)
-    nulls_df = nulls.reset_index()
-    nulls_df.columns = ['Column Name', 'Percentage (%)']
-    st.dataframe(nulls_df, use_container_width=True)
-
-    st.markdown("---") 
-    st.subheader("📊 Summary Report")
-
-    summary_data = {
-        "Check": [
-            "Table Presence in Both DBs",
-            "Row Count Match",
-            "Column Count Match",
-            "Duplicate Rows (SQLite)",
-            "Duplicate Rows (Snowflake)"
-        ],
-        "Result": [
-            "✅ Present in both" if selected_table in common_tables else "❌ Missing in one",
-            "✅ Match" if match else "❌ Mismatch",
-            "✅ Match" if schema_source['name'].count() == schema_target['COLUMN_NAME'].count() else "❌ Mismatch",
-            f"{duplicates_sqlite} duplicates",
-            f"{duplicates_snowflake} duplicates"
-        ]
-    }
-
-    summary_df = pd.DataFrame(summary_data)
-    st.dataframe(summary_df, use_container_width=True)
-
-
-    st.markdown("### 🧪 Null Value Comparison (Source vs Target)")
-
-    # Get null percentages and round to 0 decimals
-    nulls_sqlite = quality_checks.check_nulls(sample_source).round(0)
-    nulls_snowflake = quality_checks.check_nulls(sample_target).round(0)
-
-    # Standardize column names to uppercase
-    nulls_sqlite.index = nulls_sqlite.index.str.upper()
-    nulls_snowflake.index = nulls_snowflake.index.str.upper()
+        # Sample Data Comparison
+        st.subheader("Sample Data Comparison")
+        # Both sides sample the same primary keys (hash of the key below a rate), about 120 rows
+        sample_source, sample_target = executor.results(*sample_futures)
+
+        st.markdown("**Source Sample Data (SQLite):**")
+        st.dataframe(sample_source)
+
+        st.markdown("**Target Sample Data (Snowflake):**")
+        st.dataframe(sample_target)
+
+        sample_diff = comparator.diff_frames(sample_source, sample_target, sample_key)
+        st.markdown("**Sample Row Differences:**")
+        st.dataframe(comparator.diff_summary(sample_diff), use_container_width=True)
+        one_sided = sample_diff['source_only_columns'] + sample_diff['target_only_columns']
+        if one_sided:
+            st.warning(f"Not compared, present on one side only: {', '.join(one_sided)}")
+
+        if st.button("Export sample rows"):
+            path = os.path.join(drilldown.DEFAULT_EXPORT_DIR, f"{selected_table.lower()}_sample.parquet")
+            with connection_pool.get_pool(SOURCE[0]).connection() as conn_source, \
+                    connection_pool.get_pool(TARGET[0]).connection() as conn_target:
+                written = drilldown.export_sample(conn_source, conn_target, selected_table, sample_key, sample_rate,
+                                                  path, source=SOURCE[1], target=TARGET[1])
+            st.success(f"Wrote {written} rows to {os.path.abspath(path)}")
+
+    # Whole-table profiles, computed in the database with one scan per side
+    if show_quality or show_summary:
+        profile_source, profile_target = executor.results(*profile_futures)
+        duplicates_sqlite = profile_source['duplicates']
+        duplicates_snowflake = profile_target['duplicates']
+
+    if show_quality:
+        col1, col2 = st.columns(2)
+
+        with col1:
+            st.markdown("**Duplicate Row Count (SQLite):**")
+            st.write(duplicates_sqlite)
+
+        with col2:
+            st.markdown("**Duplicate Row Count (Snowflake):**")
+            st.write(duplicates_snowflake)
 
-    # Combine and compare
-    null_comparison = pd.concat([nulls_sqlite, nulls_snowflake], axis=1)
-    null_comparison.columns = ['SQLite (%)', 'Snowflake (%)']
+        st.markdown("---") 
 
-    # Replace NaN with 0 before calculating difference
-    null_comparison.fillna(0, inplace=True)
+        # Data Quality Checks on source
+        st.subheader("Data Quality Checks (Source)")
+        st.markdown("**Null Value Percentage per Column (SQLite):**")
+        nulls = profile_source['nulls']
+        nulls_df = nulls.reset_index()
+        nulls_df.columns = ['Column Name', 'Percentage (%)']
+        st.dataframe(nulls_df, use_container_width=True)
+
+        st.markdown("**Null Value Percentage per Column (Snowflake):**")
+        nulls = profile_target['nulls']
+        nulls_df = nulls.reset_index()
+        nulls_df.columns = ['Column Name', 'Percentage (%)']
+        st.dataframe(nulls_df, use_container_width=True)
+
+    if show_summary:
+        st.markdown("---") 
+        st.subheader("📊 Summary Report")
 
-    # Calculate and cast
-    null_comparison['Difference'] = (null_comparison['SQLite (%)'] - null_comparison['Snowflake (%)']).abs().astype(int)
-    null_comparison[['SQLite (%)', 'Snowflake (%)']] = null_comparison[['SQLite (%)', 'Snowflake (%)']].astype(int)
+        summary_data = {
+            "Check": [
+                "Table Presence in Both DBs",
+                "Row Count Match",
+                "Column Count Match",
+                "Duplicate Rows (SQLite)",
+                "Duplicate Rows (Snowflake)"
+            ],
+            "Result": [
+                "✅ Present in both" if selected_table in common_tables else "❌ Missing in one",
+                "✅ Match" if match else "❌ Mismatch",
+                "✅ Match" if schema_source['name'].count() == schema_target['COLUMN_NAME'].count() else "❌ Mismatch",
+                f"{duplicates_sqlite} duplicates",
+                f"{duplicates_snowflake} duplicates"
+            ]
+        }
 
-    # Prepare for display
-    null_comparison.reset_index(inplace=True)
-    null_comparison.rename(columns={'index': 'Column Name'}, inplace=True)
+        summary_df = pd.DataFrame(summary_data)
+        st.dataframe(summary_df, use_container_width=True)
 
-    # Highlight differences
-    def highlight_diff(val):
-        return 'background-color: orange' if val > 0 else ''
 
-    # Display with highlighting
-    st.dataframe(null_comparison.style.applymap(highlight_diff, subset=['Difference']), use_container_width=True)
+    if show_quality:
+        st.markdown("### 🧪 Null Value Comparison (Source vs Target)")
+
+        # Get null percentages and round to 0 decimals
+        nulls_sqlite = profile_source['nulls'].round(0)
+        nulls_snowflake = profile_target['nulls'].round(0)
+
+        # Standardize column names to uppercase
+        nulls_sqlite.index = nulls_sqlite.index.str.upper()
+        nulls_snowflake.index = nulls_snowflake.index.str.upper()
+
+        # Combine and compare
+        null_comparison = pd.concat([nulls_sqlite, nulls_snowflake], axis=1)
+        null_comparison.columns = ['SQLite (%)', 'Snowflake (%)']
+
+        # Replace NaN with 0 before calculating difference
+        null_comparison.fillna(0, inplace=True)
+
+        # Calculate and cast
+        null_comparison['Difference'] = (null_comparison['SQLite (%)'] - null_comparison['Snowflake (%)']).abs().astype(int)
+        null_comparison[['SQLite (%)', 'Snowflake (%)']] = null_comparison[['SQLite (%)', 'Snowflake (%)']].astype(int)
+
+        # Prepare for display
+        null_comparison.reset_index(inplace=True)
+        null_comparison.rename(columns={'index': 'Column Name'}, inplace=True)
+
+        # Highlight differences
+        def highlight_diff(val):
+            return 'background-color: orange' if val > 0 else ''
+
+        # Display with highlighting
+        st.dataframe(null_comparison.style.applymap(highlight_diff, subset=['Difference']), use_container_width=True)
+
+    if show_rules:
+        st.markdown("### 📏 Validation Rules (config/validation_rules.json)")
+        # Every rule of the table is evaluated in one aggregate query per side
+        rules_source, rules_target = executor.results(*rules_futures)
+        if rules_source is None:
+            st.info("No rules configured for this table.")
+        else:
+            col1, col2 = st.columns(2)
+            with col1:
+                st.markdown("**Source (SQLite):**")
+                st.dataframe(rules_source, use_container_width=True)
+            with col2:
+                st.markdown("**Target (Snowflake):**")
+                st.dataframe(rules_target, use_container_width=True)
+
+    if show_foreign_keys:
+        st.markdown("### 🔗 Referential Integrity")
+        # Orphans are counted with an anti-join in each database
+        fk_source, fk_target = executor.results(*foreign_key_futures)
+        if fk_source.empty:
+            st.info("No foreign keys involve this table.")
+        else:
+            st.markdown("**Source (SQLite):**")
+            st.dataframe(fk_source, use_container_width=True)
+            st.markdown("**Target (Snowflake):**")
+            st.dataframe(fk_target, use_container_width=True)
+
+    # Approximate distinct counts and quantiles, for tables too big for exact profiling
+    if st.button("Check distribution drift (approximate)"):
+        (approx_source, sketch_source), (approx_target, sketch_target) = executor.results(
+            *submit_check('approximate_profile', sketches.approximate_profile)
+        )
+        drift = sketches.compare_distributions(approx_source, approx_target, sketch_source=sketch_source,
+                                               sketch_target=sketch_target)
+        drifting = drift.index[drift['distinct_drift'] | drift['quantile_drift']].tolist()
+        if drifting:
+            st.error(f"Distribution drift in: {', '.join(drifting)}")
+        else:
+            st.success("No distribution drift beyond the sketch error bounds.")
+        st.dataframe(drift, use_container_width=True)
+
+    # Trend of past batch runs, read from the local results store (no source/target queries)
+    with st.expander("📈 Check History"):
+        history = results_store.ResultsStore().trend(selected_table)
+        if history.empty:
+            st.info("No stored results yet. Run `python -m scripts.batch_runner` to record some.")
+        else:
+            fig = px.line(history, x='checked_at', y='value', color='check_name', markers=True,
+                          title="Target minus source, per check")
+            st.plotly_chart(fig)
+            st.dataframe(history[history['status'] != 'pass'][['checked_at', 'check_name', 'status', 'detail']],
+                         use_container_width=True)
 
 else:
     if selected_snowflake_schema == 'EXL_SCHEMA':
@@ -235,6 +535,12 @@ else:
         st.dataframe(summary_df, use_container_width=True)
 
 
-# Close connections (optional, since script ends after execution)
-conn_sqlite.close()
-conn_snowflake.close()
+# Where this rerun spent its time, split into database queries and pandas/numpy work
+with st.expander("⏱️ Performance"):
+    timings = instrumentation.summary(run=run_id)
+    if timings.empty:
+        st.info("No instrumented calls in this run.")
+    else:
+        st.dataframe(timings.groupby(['kind', 'backend'])['self_seconds'].sum().reset_index(), use_container_width=True)
+        st.dataframe(timings, use_container_width=True)
+        st.caption("Peak memory is only measured when DQ_TRACE_MEMORY=1.")
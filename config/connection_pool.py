@@ -0,0 +1,169 @@
+import os
+import threading
+import time
+from contextlib import contextmanager
+from functools import partial
+
+from config.sqlite_config import get_sqlite_connection
+
+
+class ConnectionPool:
+    """
+    Bounded, thread-safe pool of DB-API connections.
+
+    Connections are created lazily up to `max_size` and handed out most recently
+    used first, so a warm Snowflake session is reused instead of logging in again.
+    A connection idle for longer than `health_check_interval` seconds is probed
+    with SELECT 1 on checkout and transparently replaced if the probe fails.
+    A connection whose `with pool.connection()` block raised is closed and
+    not reused.
+    """
+
+    def __init__(self, factory, max_size=4, timeout=30.0, health_check_interval=60.0):
+        self.factory = factory
+        self.max_size = max_size
+        self.timeout = timeout
+        self.health_check_interval = health_check_interval
+        self._idle = []
+        self._size = 0
+        self._cond = threading.Condition()
+        self._metrics = {
+            'created': 0,
+            'reconnects': 0,
+            'checkouts': 0,
+            'wait_time_total': 0.0,
+            'wait_time_max': 0.0,
+        }
+
+    def acquire(self, timeout=None):
+        timeout = self.timeout if timeout is None else timeout
+        start = time.monotonic()
+        conn = None
+        with self._cond:
+            while True:
+                if self._idle:
+                    conn, last_used = self._idle.pop()
+                    break
+                if self._size < self.max_size:
+                    self._size += 1
+                    break
+                remaining = timeout - (time.monotonic() - start)
+                if remaining <= 0:
+                    raise TimeoutError(f"No connection available within {timeout} seconds.")
+                self._cond.wait(remaining)
+            waited = time.monotonic() - start
+            self._metrics['checkouts'] += 1
+            self._metrics['wait_time_total'] += waited
+            self._metrics['wait_time_max'] = max(self._metrics['wait_time_max'], waited)
+
+        if conn is None:
+            return self._create()
+        if time.monotonic() - last_used > self.health_check_interval and not _is_healthy(conn):
+            _close_quietly(conn)
+            with self._cond:
+                self._metrics['reconnects'] += 1
+            return self._create()
+        return conn
+
+    def _create(self):
+        # The slot was reserved by acquire(); give it back if connecting fails
+        try:
+            conn = self.factory()
+        except Exception:
+            with self._cond:
+                self._size -= 1
+                self._cond.notify()
+            raise
+        with self._cond:
+            self._metrics['created'] += 1
+        return conn
+
+    def release(self, conn, discard=False):
+        with self._cond:
+            if discard:
+                self._size -= 1
+            else:
+                self._idle.append((conn, time.monotonic()))
+            self._cond.notify()
+        if discard:
+            _close_quietly(conn)
+
+    @contextmanager
+    def connection(self, timeout=None):
+        conn = self.acquire(timeout)
+        try:
+            yield conn
+        except BaseException:
+            # The session may be broken or mid-transaction, so it is closed rather than handed to the next caller
+            self.release(conn, discard=True)
+            raise
+        self.release(conn)
+
+    def stats(self):
+        with self._cond:
+            stats = dict(self._metrics)
+            stats['size'] = self._size
+            stats['idle'] = len(self._idle)
+            stats['in_use'] = self._size - len(self._idle)
+            return stats
+
+    def close_all(self):
+        with self._cond:
+            idle, self._idle = self._idle, []
+            self._size -= len(idle)
+        for conn, _ in idle:
+            _close_quietly(conn)
+
+
+def _is_healthy(conn):
+    try:
+        cur = conn.cursor()
+        cur.execute("SELECT 1")
+        cur.fetchone()
+        cur.close()
+        return True
+    except Exception:
+        return False
+
+
+def _close_quietly(conn):
+    try:
+        conn.close()
+    except Exception:
+        pass
+
+
+def _snowflake_factory():
+    # Imported lazily so that SQLite-only runs don't need Snowflake credentials
+    from config.snowflake_config import get_snowflake_connection
+    return get_snowflake_connection()
+
+
+FACTORIES = {
+    # Pooled SQLite connections move between threads, one user at a time
+    'sqlite': partial(get_sqlite_connection, check_same_thread=False),
+    'snowflake': _snowflake_factory,
+}
+
+_pools = {}
+_pools_lock = threading.Lock()
+
+
+def get_pool(backend, factory=None, max_size=None):
+    """
+    Returns the process-wide pool for a backend, creating it on first use.
+    Pools live at module level, so they are shared by every Streamlit rerun
+    and session served by this process.
+    """
+    with _pools_lock:
+        if backend not in _pools:
+            if max_size is None:
+                max_size = int(os.environ.get(f"DQ_{backend.upper()}_POOL_SIZE", 4))
+            _pools[backend] = ConnectionPool(factory or FACTORIES[backend], max_size=max_size)
+        return _pools[backend]
+
+
+def pool_stats():
+    with _pools_lock:
+        return {backend: pool.stats() for backend, pool in _pools.items()}
+
@@ -1,8 +1,9 @@
 import sqlite3
 import os
 
-def get_sqlite_connection():
+def get_sqlite_connection(db_path=None, check_same_thread=True):
     # Ensure the data folder exists and the DB is at the right path
-    db_path = os.path.join(os.path.dirname(__file__), "..", "data", "source_data.sqlite")
-    conn = sqlite3.connect(db_path)
+    if db_path is None:
+        db_path = os.path.join(os.path.dirname(__file__), "..", "data", "source_data.sqlite")
+    conn = sqlite3.connect(db_path, check_same_thread=check_same_thread)
     return conn
@@ -0,0 +1,353 @@
+"""
+Headless reconciliation of every table the source and target have in common.
+
+    python -m scripts.batch_runner --output report.json --concurrency 4
+
+Exit code is 0 when every table matches, 1 when at least one table has a
+mismatch and 2 when a table could not be checked (error or timeout).
+
+Tables whose change fingerprint (see data_fetcher.get_table_versions) has not
+moved on either side since their last check are not queried again; their
+stored result is reported instead. Use --force to re-check them.
+"""
+import argparse
+import csv
+import json
+import logging
+import math
+import sqlite3
+import sys
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+from functools import partial
+
+from config import connection_pool
+from config.sqlite_config import get_sqlite_connection
+from scripts import comparator, data_fetcher, incremental, partitioned, profiler, results_store
+
+NULL_TOLERANCE = 0.0
+
+logger = logging.getLogger('dq.batch_runner')
+
+
+def find_common_tables(conn_source, conn_target, source='sqlite', target='snowflake', schema=''):
+    # One bulk query per side, which also warms the per-table schema cache
+    tables_source = data_fetcher.get_all_table_schemas(conn_source, source=source)
+    tables_target = data_fetcher.get_all_table_schemas(conn_target, source=target, schema=schema)
+    return sorted(set(tables_source) & set(tables_target))
+
+
+def compare_profiles(table_name, columns_source, columns_target, profile_source, profile_target):
+    """
+    Turns the two whole-table profiles of a table into one report row.
+    """
+    nulls_source = profile_source['nulls'].rename(index=str.upper)
+    nulls_target = profile_target['nulls'].rename(index=str.upper)
+    null_diff = (nulls_source - nulls_target).abs()
+    null_mismatches = sorted(null_diff[null_diff > NULL_TOLERANCE].index)
+
+    columns_source = {c.upper() for c in columns_source}
+    columns_target = {c.upper() for c in columns_target}
+
+    checks = {
+        'row_count': profile_source['row_count'] == profile_target['row_count'],
+        'schema': columns_source == columns_target,
+        'nulls': not null_mismatches,
+        'duplicates': profile_source['duplicates'] == profile_target['duplicates'],
+    }
+    return {
+        'table': table_name,
+        'status': 'match' if all(checks.values()) else 'mismatch',
+        'failed_checks': [name for name, passed in checks.items() if not passed],
+        'row_count_source': profile_source['row_count'],
+        'row_count_target': profile_target['row_count'],
+        'columns_source': len(columns_source),
+        'columns_target': len(columns_target),
+        'columns_missing_in_target': sorted(columns_source - columns_target),
+        'columns_extra_in_target': sorted(columns_target - columns_source),
+        'duplicates_source': profile_source['duplicates'],
+        'duplicates_target': profile_target['duplicates'],
+        'null_mismatch_columns': null_mismatches,
+    }
+
+
+def _arm_timeout(conn, source, timeout):
+    """
+    Makes the queries on `conn` give up once `timeout` seconds have passed,
+    however many statements that is: a timer thread interrupts the SQLite
+    connection or cancels the Snowflake session's queries. On Snowflake
+    STATEMENT_TIMEOUT_IN_SECONDS also caps every statement server-side.
+    Returns a callable that disarms the timeout and, on Snowflake, resets the
+    session parameter so it does not stay on the pooled connection.
+    """
+    if source == 'snowflake':
+        conn.cursor().execute(f"ALTER SESSION SET STATEMENT_TIMEOUT_IN_SECONDS = {max(1, math.ceil(timeout))}")
+        timer = threading.Timer(timeout, _cancel_snowflake_queries, (conn,))
+        timer.daemon = True
+        timer.start()
+
+        def disarm():
+            timer.cancel()
+            conn.cursor().execute("ALTER SESSION UNSET STATEMENT_TIMEOUT_IN_SECONDS")
+        return disarm
+    timer = threading.Timer(timeout, conn.interrupt)
+    timer.daemon = True
+    timer.start()
+    return timer.cancel
+
+
+def _cancel_snowflake_queries(conn):
+    # Runs on the timer thread, on a second cursor while the checked one is busy
+    try:
+        conn.cursor().execute(f"SELECT SYSTEM$CANCEL_ALL_QUERIES({conn.session_id})")
+    except Exception:
+        logger.warning("Could not cancel the queries of Snowflake session %s", conn.session_id, exc_info=True)
+
+
+# Snowflake error numbers of a canceled statement (604) and of a statement timeout (630)
+SNOWFLAKE_TIMEOUT_ERRNOS = (604, 630)
+
+
+def _is_timeout(error):
+    # Both are raised by _arm_timeout: an interrupted SQLite query, a canceled or timed-out Snowflake one
+    if isinstance(error, sqlite3.OperationalError):
+        return 'interrupt' in str(error)
+    if type(error).__module__.startswith('snowflake.connector'):
+        return getattr(error, 'errno', None) in SNOWFLAKE_TIMEOUT_ERRNOS or 'canceled' in str(error).lower()
+    return False
+
+
+def check_table(table_name, source_side, target_side, timeout=300, retries=1, retry_delay=2.0,
+                incremental_mode=False, fingerprints=False, partitions=None):
+    """
+    Runs the row count, schema, null and duplicate checks for one table.
+
+    Each side is a (pool name, source type) pair. Attempts that fail or time out
+    are retried up to `retries` times; the returned row always has a 'status'
+    of match, mismatch, error or timeout. With `incremental_mode` the profiles
+    only scan rows above the stored primary-key watermark; with `fingerprints`
+    the per-column fingerprints are compared too. With `partitions`, SQLite
+    tables are profiled by that many worker processes (the timeout then only
+    applies to the metadata queries).
+    """
+    start = time.monotonic()
+    attempts = 0
+    error = None
+    while attempts <= retries:
+        attempts += 1
+        try:
+            with connection_pool.get_pool(source_side[0]).connection() as conn_source, \
+                    connection_pool.get_pool(target_side[0]).connection() as conn_target:
+                disarm = [_arm_timeout(conn_source, source_side[1], timeout),
+                          _arm_timeout(conn_target, target_side[1], timeout)]
+                try:
+                    columns_source = data_fetcher.get_column_names(conn_source, table_name, source=source_side[1])
+                    columns_target = data_fetcher.get_column_names(conn_target, table_name, source=target_side[1])
+                    if incremental_mode:
+                        key_column = data_fetcher.get_primary_key(conn_source, table_name, source=source_side[1])
+                        profile_source = incremental.incremental_profile(conn_source, table_name, key_column,
+                                                                         source=source_side[1])
+                        profile_target = incremental.incremental_profile(conn_target, table_name, key_column,
+                                                                         source=target_side[1])
+                    elif partitions:
+                        profile_source = partitioned.profile_table(conn_source, table_name, source=source_side[1],
+                                                                   partitions=partitions)
+                        profile_target = partitioned.profile_table(conn_target, table_name, source=target_side[1],
+                                                                   partitions=partitions)
+                    else:
+                        profile_source = profiler.profile_table(conn_source, table_name, source=source_side[1])
+                        profile_target = profiler.profile_table(conn_target, table_name, source=target_side[1])
+                    drifted = None
+                    if fingerprints:
+                        drifted = comparator.drifted_columns(comparator.compare_fingerprints(
+                            comparator.column_fingerprints(conn_source, table_name, source=source_side[1]),
+                            comparator.column_fingerprints(conn_target, table_name, source=target_side[1])
+                        ))
+                except BaseException:
+                    # The connections are discarded (see connection_pool), so a failed reset does not matter
+                    for cancel in disarm:
+                        try:
+                            cancel()
+                        except Exception:
+                            pass
+                    raise
+                for cancel in disarm:
+                    cancel()
+            row = compare_profiles(table_name, columns_source, columns_target, profile_source, profile_target)
+            if drifted is not None:
+                row['drifted_columns'] = drifted
+                if drifted:
+                    row['failed_checks'].append('fingerprint')
+                    row['status'] = 'mismatch'
+            row.update(attempts=attempts, seconds=round(time.monotonic() - start, 3), error='')
+            return row
+        except Exception as e:
+            error = e
+            if attempts <= retries:
+                time.sleep(retry_delay * attempts)
+
+    timed_out = _is_timeout(error)
+    return {
+        'table': table_name,
+        'status': 'timeout' if timed_out else 'error',
+        'failed_checks': [],
+        'attempts': attempts,
+        'seconds': round(time.monotonic() - start, 3),
+        'error': f"{type(error).__name__}: {error}",
+    }
+
+
+def run_batch(tables, source_side, target_side, concurrency=4, timeout=300, retries=1,
+              incremental_mode=False, fingerprints=False, partitions=None):
+    """
+    Checks all tables on a bounded thread pool, so total time follows the
+    slowest table rather than the sum of all of them.
+    """
+    with ThreadPoolExecutor(max_workers=concurrency) as executor:
+        futures = [executor.submit(check_table, table, source_side, target_side, timeout, retries,
+                                   incremental_mode=incremental_mode, fingerprints=fingerprints,
+                                   partitions=partitions)
+                   for table in tables]
+        return [f.result() for f in futures]
+
+
+def table_versions(side, schema=''):
+    # Change fingerprint of every table on one side, one metadata query
+    with connection_pool.get_pool(side[0]).connection() as conn:
+        return data_fetcher.get_table_versions(conn, source=side[1], schema=schema)
+
+
+def run_changed_tables(tables, source_side, target_side, store, schema='', force=False, versions=None, **options):
+    """
+    Like run_batch, but a table whose change fingerprint has not moved on either
+    side since its last check gets that check's stored report row (marked
+    'cached') instead of being queried again. Matches and mismatches are stored
+    with the fingerprints read before the checks ran, so a change made during
+    a check is picked up by the next run. `force` re-checks every table.
+    `versions` is a (source, target) pair of get_table_versions results the
+    caller already has.
+    """
+    mode = 'fingerprints' if options.get('fingerprints') else 'profile'
+    versions_source, versions_target = versions or (table_versions(source_side, schema),
+                                                    table_versions(target_side, schema))
+    last = {} if force else store.last_checks(mode)
+
+    cached, changed = [], []
+    for table in tables:
+        versions = (versions_source.get(table), versions_target.get(table))
+        previous = last.get(table)
+        if None not in versions and previous and (previous['source_version'], previous['target_version']) == versions:
+            cached.append(dict(previous['report'], cached=True, attempts=0, seconds=0.0))
+        else:
+            changed.append(table)
+
+    results = run_batch(changed, source_side, target_side, **options)
+    checked_at = time.time()
+    store.save_last_checks(mode, [
+        {'table_name': row['table'], 'source_version': versions_source[row['table']],
+         'target_version': versions_target[row['table']], 'checked_at': checked_at, 'report': row}
+        for row in results
+        if row['status'] in ('match', 'mismatch') and row['table'] in versions_source and row['table'] in versions_target
+    ])
+    return sorted(cached + results, key=lambda row: row['table'])
+
+
+def write_report(results, path):
+    if path.lower().endswith('.csv'):
+        fields = []
+        for row in results:
+            fields.extend(k for k in row if k not in fields)
+        with open(path, 'w', newline='') as f:
+            writer = csv.DictWriter(f, fieldnames=fields)
+            writer.writeheader()
+            for row in results:
+                writer.writerow({k: ';'.join(v) if isinstance(v, list) else v for k, v in row.items()})
+    else:
+        with open(path, 'w') as f:
+            json.dump({'generated_at': time.strftime('%Y-%m-%dT%H:%M:%S'), 'tables': results},
+                      f, indent=2, default=int)
+
+
+def exit_code(results):
+    statuses = {row['status'] for row in results}
+    if statuses & {'error', 'timeout'}:
+        return 2
+    if 'mismatch' in statuses:
+        return 1
+    return 0
+
+
+def resolve_sides(target_db=None, concurrency=4, prefix=''):
+    """
+    Returns the (pool name, source type) pairs for source and target. The target
+    is Snowflake unless a SQLite target file is given or Snowflake is not
+    configured, in which case SQLite stands in for it like in app.py.
+    Pool names start with `prefix`, so a caller can get pools of its own.
+    """
+    # Every table holds one connection per side while it is checked
+    connection_pool.get_pool(f'{prefix}sqlite', factory=connection_pool.FACTORIES['sqlite'],
+                             max_size=2 * concurrency)
+    source_side = (f'{prefix}sqlite', 'sqlite')
+    if target_db:
+        factory = partial(get_sqlite_connection, target_db, check_same_thread=False)
+        connection_pool.get_pool(f'{prefix}sqlite-target', factory=factory, max_size=concurrency)
+        return source_side, (f'{prefix}sqlite-target', 'sqlite')
+    try:
+        pool = connection_pool.get_pool(f'{prefix}snowflake', factory=connection_pool.FACTORIES['snowflake'],
+                                        max_size=concurrency)
+        pool.release(pool.acquire())
+        return source_side, (f'{prefix}snowflake', 'snowflake')
+    except Exception as e:
+        logger.warning("Snowflake connection not configured (%s). Using SQLite as the target.", e)
+        return source_side, (f'{prefix}sqlite', 'sqlite')
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Run data quality checks for every common table.")
+    parser.add_argument('--output', default='dq_report.json', help="Report path (.json or .csv)")
+    parser.add_argument('--schema', default='', help="Snowflake schema holding the target tables")
+    parser.add_argument('--target-db', help="Use this SQLite file as the target instead of Snowflake")
+    parser.add_argument('--tables', nargs='*', help="Only check these tables")
+    parser.add_argument('--concurrency', type=int, default=4)
+    parser.add_argument('--timeout', type=float, default=300, help="Per-table timeout in seconds")
+    parser.add_argument('--retries', type=int, default=1)
+    parser.add_argument('--incremental', action='store_true',
+                        help="Only scan rows above each table's stored primary-key watermark")
+    parser.add_argument('--fingerprints', action='store_true',
+                        help="Also compare per-column fingerprints (one more scan per side)")
+    parser.add_argument('--partitions', type=int,
+                        help="Profile SQLite tables in this many key-range partitions, one worker process each")
+    parser.add_argument('--force', action='store_true',
+                        help="Re-check tables whose change fingerprint has not moved since their last check")
+    parser.add_argument('--no-history', action='store_true', help="Do not record results in the history store")
+    parser.add_argument('--keep-days', type=int, default=30,
+                        help="Keep every stored result this many days, then one per table, check and day")
+    parser.add_argument('--retention-days', type=int, default=365, help="Delete stored results older than this")
+    args = parser.parse_args(argv)
+
+    logging.basicConfig()
+    source_side, target_side = resolve_sides(args.target_db, args.concurrency)
+    with connection_pool.get_pool(source_side[0]).connection() as conn_source, \
+            connection_pool.get_pool(target_side[0]).connection() as conn_target:
+        tables = find_common_tables(conn_source, conn_target, source_side[1], target_side[1], args.schema)
+    if args.tables:
+        tables = [t for t in tables if t in {name.lower() for name in args.tables}]
+
+    store = results_store.ResultsStore()
+    results = run_changed_tables(tables, source_side, target_side, store, schema=args.schema, force=args.force,
+                                 concurrency=args.concurrency, timeout=args.timeout, retries=args.retries,
+                                 incremental_mode=args.incremental, fingerprints=args.fingerprints,
+                                 partitions=args.partitions)
+    write_report(results, args.output)
+    if not args.no_history:
+        store.record(results_store.rows_from_report(results))
+        store.compact(keep_days=args.keep_days, retention_days=args.retention_days)
+    for row in results:
+        cached = " (unchanged, cached)" if row.get('cached') else ""
+        print(f"{row['table']:<20} {row['status']:<9} {', '.join(row['failed_checks'])}{cached}")
+    return exit_code(results)
+
+
+if __name__ == '__main__':
+    sys.exit(main())
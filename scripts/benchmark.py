@@ -0,0 +1,233 @@
+"""
+Offline benchmarks of the fetch, check and comparison paths at several scales.
+
+    python -m scripts.benchmark --scales 10000 100000 1000000 --output benchmark.csv
+
+For every scale a source database with that many transactions and a drifted
+target copy are generated (or reused from --data-dir), then each benchmark is
+timed on the Transactions table. Peak memory is measured in separate runs so
+the measuring does not distort the timings: Python allocations with
+tracemalloc, and the growth of the resident set size and of pyarrow's memory
+pool (which tracemalloc cannot see) by sampling them on a background thread.
+"""
+import argparse
+import os
+import sys
+import tempfile
+import threading
+import time
+import tracemalloc
+
+import pandas as pd
+
+from config.sqlite_config import get_sqlite_connection
+from scripts import comparator, create_mock_data, data_fetcher, profiler, quality_checks, sketches
+
+TABLE = 'Transactions'
+KEY = 'TransactionID'
+
+
+def _chunked_scan(conn, _):
+    return sum(len(chunk) for chunk in data_fetcher.iter_table_chunks(conn, TABLE))
+
+
+def _in_memory_checks(conn, _):
+    df = pd.read_sql_query(f"SELECT * FROM {TABLE}", conn)
+    quality_checks.check_nulls(df)
+    quality_checks.check_duplicates(df)
+    quality_checks.basic_stats(df)
+    return len(df)
+
+
+def _chunked_checks(conn, _):
+    return quality_checks.run_chunked_checks(data_fetcher.iter_table_chunks(conn, TABLE)).row_count
+
+
+def _key_sample_diff(conn_source, conn_target):
+    sample_source = data_fetcher.get_key_sample(conn_source, TABLE, KEY, 0.01)
+    sample_target = data_fetcher.get_key_sample(conn_target, TABLE, KEY, 0.01)
+    comparator.diff_frames(sample_source, sample_target, KEY)
+    return len(sample_source) + len(sample_target)
+
+
+def _fingerprints(conn_source, conn_target):
+    comparator.compare_fingerprints(comparator.column_fingerprints(conn_source, TABLE),
+                                    comparator.column_fingerprints(conn_target, TABLE))
+    return None
+
+
+def _diff_tables(conn_source, conn_target):
+    comparator.diff_tables(conn_source, conn_target, TABLE, KEY, source='sqlite', target='sqlite')
+    return None
+
+
+# (name, group, fn(conn_source, conn_target) -> rows (or tables) processed, None for the whole table)
+BENCHMARKS = [
+    ('row_count', 'fetch', lambda s, t: data_fetcher.get_table_row_count(s, TABLE)),
+    ('sample', 'fetch', lambda s, t: len(data_fetcher.get_sample_data(s, TABLE, n=1000))),
+    ('key_sample', 'fetch', lambda s, t: len(data_fetcher.get_key_sample(s, TABLE, KEY, 0.01))),
+    ('all_table_schemas', 'fetch', lambda s, t: len(data_fetcher.get_all_table_schemas(s))),
+    ('chunked_scan', 'fetch', _chunked_scan),
+    ('arrow_scan', 'fetch', lambda s, t: data_fetcher.fetch_arrow(s, f"SELECT * FROM {TABLE}").num_rows),
+    ('in_memory_checks', 'checks', _in_memory_checks),
+    ('chunked_checks', 'checks', _chunked_checks),
+    ('pushdown_profile', 'checks', lambda s, t: profiler.profile_table(s, TABLE)['row_count']),
+    ('approximate_profile', 'checks', lambda s, t: sketches.approximate_profile(s, TABLE)[1].row_count),
+    ('key_sample_diff', 'compare', _key_sample_diff),
+    ('fingerprints', 'compare', _fingerprints),
+    ('hash_bisection_diff', 'compare', _diff_tables),
+]
+
+
+def prepare_databases(scale, data_dir, seed=0):
+    """
+    Returns the (source, target) paths for a scale, generating them unless
+    both already exist in `data_dir`.
+    """
+    source_path = os.path.join(data_dir, f"bench_{scale}_source.sqlite")
+    target_path = os.path.join(data_dir, f"bench_{scale}_target.sqlite")
+    if not (os.path.exists(source_path) and os.path.exists(target_path)):
+        create_mock_data.build_databases(source_path, rows=scale, seed=seed, target_path=target_path)
+    return source_path, target_path
+
+
+def _current_rss():
+    # Resident set size in bytes, None where it cannot be read
+    try:
+        import psutil
+        return psutil.Process().memory_info().rss
+    except ImportError:
+        pass
+    try:
+        with open('/proc/self/statm') as f:
+            return int(f.read().split()[1]) * os.sysconf('SC_PAGE_SIZE')
+    except (OSError, ValueError, AttributeError):
+        return None
+
+
+def _arrow_allocated():
+    # Bytes currently held by pyarrow's default memory pool, None without pyarrow
+    try:
+        import pyarrow as pa
+    except ImportError:
+        return None
+    return pa.default_memory_pool().bytes_allocated()
+
+
+def sampled_peaks(fn, interval=0.005):
+    """
+    Runs fn() while a thread samples the RSS and pyarrow's allocated bytes
+    every `interval` seconds. Returns the peak growth of each over its value
+    before the run, in bytes (None when it cannot be read).
+    """
+    baseline = {'rss': _current_rss(), 'arrow': _arrow_allocated()}
+    peaks = dict(baseline)
+    stop = threading.Event()
+
+    def sample():
+        while True:
+            for name, current in (('rss', _current_rss()), ('arrow', _arrow_allocated())):
+                if current is not None:
+                    peaks[name] = max(peaks[name], current)
+            if stop.wait(interval):
+                break
+
+    sampler = threading.Thread(target=sample, daemon=True)
+    sampler.start()
+    try:
+        fn()
+    finally:
+        stop.set()
+        sampler.join()
+    return {name: None if baseline[name] is None else peaks[name] - baseline[name] for name in baseline}
+
+
+def measure(fn, conn_source, conn_target, repeat=1):
+    """
+    Returns (best wall time in seconds, rows processed, peaks), where peaks
+    holds the tracemalloc peak ('python'), the RSS growth ('rss') and the
+    pyarrow memory pool growth ('arrow') in bytes. The metadata cache is
+    cleared before every run so each one starts cold.
+    """
+    best, rows = float('inf'), None
+    for _ in range(repeat):
+        data_fetcher.metadata_cache.invalidate()
+        start = time.perf_counter()
+        rows = fn(conn_source, conn_target)
+        best = min(best, time.perf_counter() - start)
+
+    data_fetcher.metadata_cache.invalidate()
+    tracemalloc.start()
+    try:
+        fn(conn_source, conn_target)
+        _, python_peak = tracemalloc.get_traced_memory()
+    finally:
+        tracemalloc.stop()
+
+    data_fetcher.metadata_cache.invalidate()
+    peaks = sampled_peaks(lambda: fn(conn_source, conn_target))
+    peaks['python'] = python_peak
+    return best, rows, peaks
+
+
+def run_benchmarks(scales, data_dir, names=None, repeat=1, seed=0):
+    results = []
+    for scale in scales:
+        source_path, target_path = prepare_databases(scale, data_dir, seed=seed)
+        conn_source = get_sqlite_connection(source_path)
+        conn_target = get_sqlite_connection(target_path)
+        try:
+            table_rows = data_fetcher.get_table_row_count(conn_source, TABLE)
+            for name, group, fn in BENCHMARKS:
+                if names and name not in names:
+                    continue
+                seconds, rows, peaks = measure(fn, conn_source, conn_target, repeat=repeat)
+                rows = table_rows if rows is None else rows
+                mib = {name: None if peak is None else round(peak / 2 ** 20, 2) for name, peak in peaks.items()}
+                results.append({
+                    'scale': scale,
+                    'benchmark': name,
+                    'group': group,
+                    'seconds': round(seconds, 4),
+                    'rows': rows,
+                    'rows_per_sec': round(rows / seconds) if seconds else None,
+                    'peak_mib': mib['python'],
+                    'arrow_peak_mib': mib['arrow'],
+                    'rss_peak_mib': mib['rss'],
+                })
+                print(f"{scale:>10} {name:<22} {seconds:9.3f}s {mib['python']:9.1f} MiB python, "
+                      f"{mib['arrow']} MiB arrow, {mib['rss']} MiB RSS", file=sys.stderr)
+        finally:
+            conn_source.close()
+            conn_target.close()
+    return pd.DataFrame(results)
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Benchmark the data quality checks at several scales.")
+    parser.add_argument('--scales', type=int, nargs='+', default=[10000, 100000])
+    parser.add_argument('--data-dir', help="Keep (and reuse) the generated databases in this directory")
+    parser.add_argument('--benchmarks', nargs='*', help="Only run these benchmarks")
+    parser.add_argument('--repeat', type=int, default=1, help="Report the best of this many timed runs")
+    parser.add_argument('--seed', type=int, default=0)
+    parser.add_argument('--output', help="Also write the results to this path (.csv or .json)")
+    args = parser.parse_args(argv)
+
+    if args.data_dir:
+        os.makedirs(args.data_dir, exist_ok=True)
+        results = run_benchmarks(args.scales, args.data_dir, args.benchmarks, args.repeat, args.seed)
+    else:
+        with tempfile.TemporaryDirectory() as data_dir:
+            results = run_benchmarks(args.scales, data_dir, args.benchmarks, args.repeat, args.seed)
+
+    print(results.to_string(index=False))
+    if args.output:
+        if args.output.lower().endswith('.csv'):
+            results.to_csv(args.output, index=False)
+        else:
+            results.to_json(args.output, orient='records', indent=2)
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -1,4 +1,286 @@
+import math
+import numbers
+from collections import Counter
+
 import pandas as pd
 
+from scripts import data_fetcher, hashing, profiler
+
 def compare_row_counts(count_source, count_target):
     return count_source == count_target, count_source, count_target
+
+
+def _bucket_expr(key_column, lo, width, source):
+    if source == 'sqlite':
+        return f"({key_column} - {lo}) / {width}"
+    elif source == 'snowflake':
+        return f"FLOOR(({key_column} - {lo}) / {width})"
+    else:
+        raise ValueError("Unsupported source type.")
+
+
+def _key_bounds(conn, table_name, key_column):
+    cur = conn.cursor()
+    cur.execute(f"SELECT MIN({key_column}), MAX({key_column}) FROM {table_name}")
+    return cur.fetchone()
+
+
+def _range_checksums(conn, table_name, key_column, columns, lo, hi, width, source):
+    """
+    Returns {bucket: (row_count, hash_sum)} for every key bucket of the given
+    width inside [lo, hi], computed with one GROUP BY query in the database.
+    """
+    bucket = _bucket_expr(key_column, lo, width, source)
+    row_hash = hashing.sql_row_hash(columns, source=source)
+    query = f"""
+    SELECT {bucket} AS bucket, COUNT(*), SUM({row_hash})
+    FROM {table_name}
+    WHERE {key_column} BETWEEN {lo} AND {hi}
+    GROUP BY 1
+    """
+    cur = conn.cursor()
+    cur.execute(query)
+    return {int(b): (int(n), int(h)) for b, n, h in cur.fetchall()}
+
+
+def _range_rows(conn, table_name, key_column, columns, lo, hi, source):
+    # Returns {key: [row_hash, ...]} for the rows inside [lo, hi]; a duplicated key has several hashes
+    row_hash = hashing.sql_row_hash(columns, source=source)
+    query = f"""
+    SELECT {key_column}, {row_hash}
+    FROM {table_name}
+    WHERE {key_column} BETWEEN {lo} AND {hi}
+    """
+    cur = conn.cursor()
+    cur.execute(query)
+    rows = {}
+    for k, h in cur.fetchall():
+        rows.setdefault(int(k), []).append(int(h))
+    return rows
+
+
+def _diff_rows(rows_source, rows_target, result):
+    """
+    Compares {key: [row_hash, ...]} of both sides as multisets per key and
+    appends to result's 'added', 'deleted' and 'changed' lists, once per
+    row: a copy of a row only one side has is added or deleted, and pairs
+    of unmatched copies under one key count as changed.
+    """
+    for key in set(rows_source) | set(rows_target):
+        extra_source = Counter(rows_source.get(key, ()))
+        extra_target = Counter(rows_target.get(key, ()))
+        extra_source, extra_target = extra_source - extra_target, extra_target - extra_source
+        n_source, n_target = sum(extra_source.values()), sum(extra_target.values())
+        changed = min(n_source, n_target)
+        result['changed'].extend([key] * changed)
+        result['deleted'].extend([key] * (n_source - changed))
+        result['added'].extend([key] * (n_target - changed))
+
+
+def shared_columns(columns_source, columns_target):
+    """
+    Splits two column lists (compared case-insensitively) into the columns both
+    have, in source order and with the source's names, and those only one has.
+    """
+    lower_source = {c.lower() for c in columns_source}
+    lower_target = {c.lower() for c in columns_target}
+    return (
+        [c for c in columns_source if c.lower() in lower_target],
+        [c for c in columns_source if c.lower() not in lower_target],
+        [c for c in columns_target if c.lower() not in lower_source],
+    )
+
+
+def diff_tables(conn_source, conn_target, table_name, key_column,
+                source='sqlite', target='snowflake', bisection_factor=16, leaf_size=256, columns=None):
+    """
+    Finds the rows that differ between two copies of a table without pulling
+    either table out of the database.
+
+    The integer primary key range is split into `bisection_factor` buckets and
+    each side computes a row count and hash sum per bucket. Only the buckets
+    whose checksums differ are split again; once a bucket holds at most
+    `leaf_size` rows, the (key, row hash) pairs are fetched and compared.
+
+    Only `columns` (plus the key) are hashed when given, e.g. the drifted
+    columns reported by compare_fingerprints; by default all columns are.
+    Either way only columns present on both sides are hashed.
+
+    Returns a dict with the sorted keys that were 'added' (target only),
+    'deleted' (source only) and 'changed', a key once per differing copy of
+    its row (see _diff_rows), the number of 'queries' run and
+    the 'source_only_columns' and 'target_only_columns' left out.
+    """
+    hashing.prepare_connection(conn_source, source=source)
+    hashing.prepare_connection(conn_target, source=target)
+    shared, source_only, target_only = shared_columns(
+        data_fetcher.get_column_names(conn_source, table_name, source=source),
+        data_fetcher.get_column_names(conn_target, table_name, source=target),
+    )
+    if columns is not None:
+        wanted = {c.lower() for c in columns} | {key_column.lower()}
+        shared = [c for c in shared if c.lower() in wanted]
+    columns = [key_column] + [c for c in shared if c.lower() != key_column.lower()]
+
+    result = {'added': [], 'deleted': [], 'changed': [], 'queries': 2,
+              'source_only_columns': source_only, 'target_only_columns': target_only}
+
+    bounds = [b for b in (_key_bounds(conn_source, table_name, key_column),
+                          _key_bounds(conn_target, table_name, key_column)) if b[0] is not None]
+    if not bounds:
+        return result
+    lo = int(min(b[0] for b in bounds))
+    hi = int(max(b[1] for b in bounds))
+
+    def compare_leaf(lo, hi):
+        rows_source = _range_rows(conn_source, table_name, key_column, columns, lo, hi, source)
+        rows_target = _range_rows(conn_target, table_name, key_column, columns, lo, hi, target)
+        result['queries'] += 2
+        _diff_rows(rows_source, rows_target, result)
+
+    def bisect(lo, hi):
+        width = max(1, -(-(hi - lo + 1) // bisection_factor))
+        sums_source = _range_checksums(conn_source, table_name, key_column, columns, lo, hi, width, source)
+        sums_target = _range_checksums(conn_target, table_name, key_column, columns, lo, hi, width, target)
+        result['queries'] += 2
+        for bucket in sorted(set(sums_source) | set(sums_target)):
+            checksum_source = sums_source.get(bucket, (0, 0))
+            checksum_target = sums_target.get(bucket, (0, 0))
+            if checksum_source == checksum_target:
+                continue
+            bucket_lo = lo + bucket * width
+            bucket_hi = min(hi, bucket_lo + width - 1)
+            if width == 1 or max(checksum_source[0], checksum_target[0]) <= leaf_size:
+                compare_leaf(bucket_lo, bucket_hi)
+            else:
+                bisect(bucket_lo, bucket_hi)
+
+    bisect(lo, hi)
+    for k in ('added', 'deleted', 'changed'):
+        result[k].sort()
+    return result
+
+
+def diff_frames(df_source, df_target, key_column):
+    """
+    Row diff of two in-memory frames holding the same key subset, e.g. two
+    data_fetcher.get_key_sample results. Only the columns both frames have are
+    hashed. Returns the same dict as diff_tables.
+    """
+    shared, source_only, target_only = shared_columns(list(df_source.columns), list(df_target.columns))
+    columns = sorted(c.upper() for c in shared)
+
+    def row_hashes(df):
+        df = df.rename(columns=str.upper)
+        keys = df[key_column.upper()].tolist()
+        hashes = [hashing.hash_values(*row) for row in df[columns].itertuples(index=False, name=None)]
+        rows = {}
+        for key, row_hash in zip(keys, hashes):
+            rows.setdefault(key, []).append(row_hash)
+        return rows
+
+    result = {'added': [], 'deleted': [], 'changed': [], 'queries': 0,
+              'source_only_columns': source_only, 'target_only_columns': target_only}
+    _diff_rows(row_hashes(df_source), row_hashes(df_target), result)
+    for k in ('added', 'deleted', 'changed'):
+        result[k].sort()
+    return result
+
+
+def diff_summary(diff):
+    # One-row-per-kind overview of a diff_tables result, for display
+    return pd.DataFrame({
+        "Difference": ["Added in target", "Deleted from target", "Changed"],
+        "Rows": [len(diff['added']), len(diff['deleted']), len(diff['changed'])]
+    })
+
+
+FINGERPRINT_METRICS = ['non_null', 'min', 'max', 'sum', 'total_length', 'hash_sum']
+
+
+def _as_text(column, source):
+    if source == 'sqlite':
+        return f"CAST({column} AS TEXT)"
+    elif source == 'snowflake':
+        return f"TO_VARCHAR({column})"
+    else:
+        raise ValueError("Unsupported source type.")
+
+
+def column_fingerprints(conn, table_name, source='sqlite'):
+    """
+    Computes a small fingerprint of every column in one pass over the table:
+    non-null count, min, max, sum (numeric columns), summed text length
+    (other columns) and an order-independent sum of value hashes.
+
+    Returns a DataFrame indexed by upper-cased column name, so that the two
+    sides line up in compare_fingerprints.
+    """
+    hashing.prepare_connection(conn, source=source)
+    column_types = data_fetcher.get_column_types(conn, table_name, source=source)
+
+    select = []
+    for name, data_type in column_types:
+        if profiler.is_numeric_type(data_type):
+            value = profiler.as_float(name, source)
+            select += [f"COUNT({name})", f"MIN({value})", f"MAX({value})", f"SUM({value})", "NULL"]
+        else:
+            select += [f"COUNT({name})", f"MIN({_as_text(name, source)})", f"MAX({_as_text(name, source)})",
+                       "NULL", f"SUM(LENGTH({_as_text(name, source)}))"]
+        select.append(f"SUM({hashing.sql_row_hash([name], source=source)})")
+
+    cur = conn.cursor()
+    cur.execute(f"SELECT {', '.join(select)} FROM {table_name}")
+    row = cur.fetchone()
+
+    width = len(FINGERPRINT_METRICS)
+    return pd.DataFrame(
+        [row[i * width:(i + 1) * width] for i in range(len(column_types))],
+        index=[name.upper() for name, _ in column_types],
+        columns=FINGERPRINT_METRICS,
+    )
+
+
+# Float aggregates, which can differ in the last bits between databases; every
+# other metric is an exact count, length or hash sum (or a min/max value)
+TOLERANT_METRICS = ('sum',)
+
+
+def _same(a, b, rel_tol=None):
+    # Without rel_tol numbers must be equal, so a change of one in a huge count or hash sum is caught
+    if a is None or b is None or (isinstance(a, float) and math.isnan(a)):
+        return (a is None or a != a) and (b is None or b != b)
+    if isinstance(a, numbers.Number) and isinstance(b, numbers.Number):
+        if rel_tol is None:
+            return a == b
+        return math.isclose(a, b, rel_tol=rel_tol, abs_tol=rel_tol)
+    return str(a) == str(b)
+
+
+def compare_fingerprints(fp_source, fp_target, rel_tol=1e-9):
+    """
+    Compares two column_fingerprints results metric by metric. Only the float
+    'sum' is compared within `rel_tol`; the other metrics must be equal.
+
+    Returns a DataFrame with one row per column, a boolean per metric (True when
+    both sides agree) and a 'drifted' flag. Columns present on one side only
+    are reported as drifted.
+    """
+    columns = list(fp_source.index) + [c for c in fp_target.index if c not in fp_source.index]
+    rows = {}
+    for column in columns:
+        if column not in fp_source.index or column not in fp_target.index:
+            rows[column] = {metric: False for metric in FINGERPRINT_METRICS}
+            continue
+        rows[column] = {
+            metric: _same(fp_source.at[column, metric], fp_target.at[column, metric],
+                          rel_tol if metric in TOLERANT_METRICS else None)
+            for metric in FINGERPRINT_METRICS
+        }
+    result = pd.DataFrame.from_dict(rows, orient='index', columns=FINGERPRINT_METRICS)
+    result['drifted'] = ~result.all(axis=1)
+    return result
+
+
+def drifted_columns(comparison):
+    return comparison.index[comparison['drifted']].tolist()
@@ -1,5 +1,8 @@
-import sqlite3
+import argparse
 import os
+import random
+import sqlite3
+from datetime import date, timedelta
 
 def create_tables(conn):
     cursor = conn.cursor()
@@ -236,14 +239,211 @@ def insert_mock_data(conn):
     
     conn.commit()
 
+FIRST_NAMES = ['Alice', 'Bob', 'Charlie', 'David', 'Eva', 'Frank', 'Grace', 'Helen', 'Ian', 'Judy',
+               'Kevin', 'Linda', 'Mike', 'Nina', 'Oscar', 'Paul', 'Sara', 'Tom', 'Uma', 'Victor']
+LAST_NAMES = ['Johnson', 'Smith', 'Brown', 'Lee', 'Green', 'Wright', 'Kim', 'Park', 'Black', 'White',
+              'Hall', 'King', 'Ford', 'Bell', 'Adams', 'Carter', 'Dean', 'Evans', 'Fox', 'Nolan']
+BASE_DATE = date(2023, 1, 1)
+
+
+def _customers(rng, ids):
+    for i in ids:
+        first, last = rng.choice(FIRST_NAMES), rng.choice(LAST_NAMES)
+        yield (i, f"{first} {last}", f"{first.lower()}.{last.lower()}{i}@example.com",
+               f"{rng.randrange(1000):03d}-{rng.randrange(1000):03d}-{rng.randrange(10000):04d}")
+
+
+def _accounts(rng, ids, customers):
+    for i in ids:
+        yield (100 + i, rng.randint(1, customers), rng.choice(('Checking', 'Savings')),
+               round(rng.uniform(100, 10000), 2))
+
+
+def _transactions(rng, ids, accounts):
+    for i in ids:
+        credit = rng.random() < 0.4
+        amount = round(rng.uniform(10, 1000), 2)
+        yield (1000 + i, 100 + rng.randint(1, accounts),
+               (BASE_DATE + timedelta(days=rng.randrange(730))).isoformat(),
+               amount if credit else -amount, 'Credit' if credit else 'Debit')
+
+
+def _loans(rng, ids, customers):
+    for i in ids:
+        start = BASE_DATE + timedelta(days=rng.randrange(730))
+        yield (2000 + i, rng.randint(1, customers), float(rng.randrange(5000, 20000, 50)),
+               round(rng.uniform(4.0, 7.0), 1), start.isoformat(),
+               (start + timedelta(days=365 * rng.randint(3, 6))).isoformat())
+
+
+def table_sizes(rows):
+    """
+    Row counts per table for a generated database with `rows` transactions,
+    keeping roughly the proportions of the hand-written data.
+    """
+    customers = max(1, rows // 10)
+    return {
+        'Customers': customers,
+        'Accounts': customers,
+        'Transactions': rows,
+        'Loans': max(1, customers * 3 // 4),
+    }
+
+
+def generate_mock_data(conn, rows=100000, batch_size=50000, seed=0):
+    """
+    Fills the four tables with `rows` transactions and proportionally many
+    customers, accounts and loans. Rows are generated lazily and written with
+    executemany in batches of `batch_size`, one transaction per batch, so memory
+    stays flat however many rows are requested. The same seed gives the same data.
+    """
+    sizes = table_sizes(rows)
+    generators = {
+        'Customers': (_customers, ()),
+        'Accounts': (_accounts, (sizes['Customers'],)),
+        'Transactions': (_transactions, (sizes['Accounts'],)),
+        'Loans': (_loans, (sizes['Customers'],)),
+    }
+    conn.execute("PRAGMA synchronous=OFF")
+    conn.execute("PRAGMA journal_mode=MEMORY")
+    for table, count in sizes.items():
+        make_rows, extra = generators[table]
+        columns = [r[1] for r in conn.execute(f"PRAGMA table_info({table})")]
+        insert = f"INSERT INTO {table} ({', '.join(columns)}) VALUES ({', '.join('?' * len(columns))})"
+        for start in range(1, count + 1, batch_size):
+            # Seeding per batch keeps each batch reproducible on its own
+            rng = random.Random(f"{seed}:{table}:{start}")
+            batch = range(start, min(start + batch_size, count + 1))
+            with conn:
+                conn.executemany(insert, make_rows(rng, batch, *extra))
+    return sizes
+
+
+def _selected(key_column, rate, salt):
+    # Deterministic pseudo-random subset of about `rate` of the rows, different for each salt
+    return f"(({key_column} * {2654435761 + salt * 40503}) % 1000003) < {int(rate * 1000003)}"
+
+
+def inject_drift(conn, delete_rate=0.001, mutate_rate=0.001, null_rate=0.01,
+                 duplicate_rate=0.001, schema_change=True):
+    """
+    Turns a copy of the source database into a drifted target:
+
+    - deletes `delete_rate` of the Transactions and Accounts rows,
+    - changes Amount/Balance on `mutate_rate` of the remaining ones,
+    - blanks the Email of `null_rate` of the Customers,
+    - duplicates `duplicate_rate` of the Transactions (the target table is
+      rebuilt without its primary key, like an unconstrained warehouse table),
+    - adds a Customers column and drops Loans.EndDate.
+
+    Returns the number of rows affected by each kind of drift.
+    """
+    drift = {}
+    with conn:
+        drift['deleted'] = (
+            conn.execute(f"DELETE FROM Transactions WHERE {_selected('TransactionID', delete_rate, 1)}").rowcount
+            + conn.execute(f"DELETE FROM Accounts WHERE {_selected('AccountID', delete_rate, 1)}").rowcount
+        )
+        drift['mutated'] = (
+            conn.execute(f"UPDATE Transactions SET Amount = Amount + 1 "
+                         f"WHERE {_selected('TransactionID', mutate_rate, 2)}").rowcount
+            + conn.execute(f"UPDATE Accounts SET Balance = ROUND(Balance * 1.01, 2) "
+                           f"WHERE {_selected('AccountID', mutate_rate, 2)}").rowcount
+        )
+        drift['nulls'] = conn.execute(
+            f"UPDATE Customers SET Email = NULL WHERE {_selected('CustomerID', null_rate, 3)}"
+        ).rowcount
+
+        drift['duplicates'] = 0
+        if duplicate_rate:
+            conn.execute("""
+            CREATE TABLE Transactions_drift (
+                TransactionID INTEGER,
+                AccountID INTEGER,
+                TransactionDate TEXT,
+                Amount REAL,
+                Type TEXT
+            );
+            """)
+            conn.execute("INSERT INTO Transactions_drift SELECT * FROM Transactions")
+            conn.execute("DROP TABLE Transactions")
+            conn.execute("ALTER TABLE Transactions_drift RENAME TO Transactions")
+            drift['duplicates'] = conn.execute(
+                f"INSERT INTO Transactions SELECT * FROM Transactions "
+                f"WHERE {_selected('TransactionID', duplicate_rate, 4)}"
+            ).rowcount
+
+        drift['schema'] = 0
+        if schema_change:
+            conn.execute("ALTER TABLE Customers ADD COLUMN LoyaltyTier TEXT")
+            conn.execute("ALTER TABLE Loans DROP COLUMN EndDate")
+            drift['schema'] = 2
+    return drift
+
+
+def copy_database(source_path, target_path):
+    # SQLite's online backup copies the file page by page without loading it into memory
+    if os.path.exists(target_path):
+        os.remove(target_path)
+    source, target = sqlite3.connect(source_path), sqlite3.connect(target_path)
+    try:
+        source.backup(target)
+    finally:
+        source.close()
+        target.close()
+
+
+def build_databases(db_path, rows=None, batch_size=50000, seed=0, target_path=None, **drift_options):
+    """
+    (Re)creates the source database at `db_path`: the hand-written rows when
+    `rows` is None, otherwise `rows` generated transactions. With
+    `target_path`, also writes a drifted copy there and returns its drift counts.
+    """
+    if os.path.exists(db_path):
+        os.remove(db_path)
+    conn = sqlite3.connect(db_path)
+    try:
+        create_tables(conn)
+        if rows is None:
+            insert_mock_data(conn)
+        else:
+            generate_mock_data(conn, rows, batch_size=batch_size, seed=seed)
+    finally:
+        conn.close()
+
+    if target_path is None:
+        return None
+    copy_database(db_path, target_path)
+    conn = sqlite3.connect(target_path)
+    try:
+        return inject_drift(conn, **drift_options)
+    finally:
+        conn.close()
+
+
 if __name__ == "__main__":
     db_dir = os.path.join(os.path.dirname(__file__), "..", "data")
     os.makedirs(db_dir, exist_ok=True)
-    db_path = os.path.join(db_dir, "source_data.sqlite")
-    
-    conn = sqlite3.connect(db_path)
-    create_tables(conn)
-    insert_mock_data(conn)
-    conn.close()
-    
-    print("Mock SQLite database created successfully at:", db_path)
+
+    parser = argparse.ArgumentParser(description="Create the mock SQLite source (and optionally a drifted target).")
+    parser.add_argument('--rows', type=int, help="Generate this many transactions instead of the hand-written data")
+    parser.add_argument('--batch-size', type=int, default=50000)
+    parser.add_argument('--seed', type=int, default=0)
+    parser.add_argument('--db-path', default=os.path.join(db_dir, "source_data.sqlite"))
+    parser.add_argument('--target-path', help="Also write a drifted copy to this path")
+    parser.add_argument('--delete-rate', type=float, default=0.001)
+    parser.add_argument('--mutate-rate', type=float, default=0.001)
+    parser.add_argument('--null-rate', type=float, default=0.01)
+    parser.add_argument('--duplicate-rate', type=float, default=0.001)
+    parser.add_argument('--no-schema-change', action='store_true')
+    args = parser.parse_args()
+
+    drift = build_databases(
+        args.db_path, rows=args.rows, batch_size=args.batch_size, seed=args.seed, target_path=args.target_path,
+        delete_rate=args.delete_rate, mutate_rate=args.mutate_rate, null_rate=args.null_rate,
+        duplicate_rate=args.duplicate_rate, schema_change=not args.no_schema_change,
+    )
+
+    print("Mock SQLite database created successfully at:", args.db_path)
+    if drift is not None:
+        print("Drifted target database created at:", args.target_path, drift)
@@ -1,5 +1,99 @@
+import os
+import threading
+import time
+from collections import OrderedDict
+
 import pandas as pd
 
+from scripts import hashing
+from scripts.instrumentation import instrumented
+
+
+class MetadataCache:
+    """
+    Small thread-safe LRU cache with a time-to-live, used for information_schema
+    lookups (schemas, table lists, column definitions) that rarely change but
+    are requested on every Streamlit rerun.
+    """
+
+    def __init__(self, ttl=300, maxsize=256):
+        self.ttl = ttl
+        self.maxsize = maxsize
+        self.hits = 0
+        self.misses = 0
+        self._entries = OrderedDict()
+        self._lock = threading.Lock()
+
+    def get_or_load(self, key, loader):
+        now = time.monotonic()
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is not None and now - entry[0] < self.ttl:
+                self._entries.move_to_end(key)
+                self.hits += 1
+                return _copy(entry[1])
+            self.misses += 1
+        value = loader()
+        self.put(key, value)
+        return _copy(value)
+
+    def put(self, key, value):
+        with self._lock:
+            self._entries[key] = (time.monotonic(), value)
+            self._entries.move_to_end(key)
+            while len(self._entries) > self.maxsize:
+                self._entries.popitem(last=False)
+
+    def invalidate(self, identity=None):
+        """
+        Drops every entry, or only the entries of one connection identity.
+        """
+        with self._lock:
+            if identity is None:
+                self._entries.clear()
+            else:
+                for key in [k for k in self._entries if k[0] == identity]:
+                    del self._entries[key]
+
+    def stats(self):
+        with self._lock:
+            return {'hits': self.hits, 'misses': self.misses, 'size': len(self._entries)}
+
+
+def _copy(value):
+    # Callers are free to mutate what they get back (app.py removes INFORMATION_SCHEMA)
+    if isinstance(value, (pd.DataFrame, pd.Series)):
+        return value.copy()
+    if isinstance(value, list):
+        return list(value)
+    if isinstance(value, dict):
+        return {k: _copy(v) for k, v in value.items()}
+    return value
+
+
+metadata_cache = MetadataCache(
+    ttl=float(os.environ.get("DQ_METADATA_TTL", 300)),
+    maxsize=int(os.environ.get("DQ_METADATA_CACHE_SIZE", 256)),
+)
+
+
+def connection_identity(conn, source='sqlite'):
+    """
+    Returns a string identifying the database behind a connection, so that
+    cached metadata survives reconnects but is never shared between databases.
+    """
+    if source == 'sqlite':
+        databases = conn.execute("PRAGMA database_list").fetchall()
+        return "sqlite:" + next((path for _, name, path in databases if name == 'main'), '')
+    elif source == 'snowflake':
+        return "snowflake:{}/{}/{}".format(
+            getattr(conn, 'account', ''), getattr(conn, 'user', ''), getattr(conn, 'database', '')
+        )
+    else:
+        raise ValueError("Unsupported source type.")
+
+
+@instrumented()
 def get_table_row_count(conn, table_name, source='sqlite'):
     """
     Returns the row count for the given table.
@@ -10,12 +104,66 @@ def get_table_row_count(conn, table_name, source='sqlite'):
     # return first value regardless of column name
     return df.iloc[0, 0]    
 
+@instrumented()
 def get_sample_data(conn, table_name, n=20, source='sqlite'):
     query = f"SELECT * FROM {table_name} LIMIT {n}"
     df = pd.read_sql_query(query, conn)
     return df
 
-def get_table_schema(conn, table_name, source='sqlite'):
+def key_sample_filter(conn, key_column, rate, source='sqlite'):
+    # WHERE condition picking the rows whose key hash falls below `rate` of the hash range
+    hashing.prepare_connection(conn, source=source)
+    threshold = int(min(max(rate, 0.0), 1.0) * hashing.HASH_MODULUS)
+    return f"{hashing.sql_row_hash([key_column], source=source)} < {threshold}"
+
+
+@instrumented()
+def get_key_sample(conn, table_name, key_column, rate, source='sqlite', method='hash', limit=None):
+    """
+    Returns a sample of roughly `rate` of the table's rows.
+
+    With method='hash' a row is picked when the hash of its primary key falls
+    below `rate` of the hash range. The hash is the same on SQLite and
+    Snowflake, so both sides return the same key subset, spread evenly over the
+    table, and the two samples can be row-diffed directly.
+    method='tablesample' uses Snowflake's SAMPLE clause instead. It is cheaper
+    but picks different rows on each side, so use it for one-sided looks only.
+    """
+    if method == 'hash':
+        query = f"""
+        SELECT * FROM {table_name}
+        WHERE {key_sample_filter(conn, key_column, rate, source=source)}
+        ORDER BY {key_column}
+        """
+    elif method == 'tablesample' and source == 'snowflake':
+        query = f"SELECT * FROM {table_name} SAMPLE ({min(max(rate, 0.0), 1.0) * 100})"
+    else:
+        raise ValueError("Unsupported sampling method for this source.")
+    if limit is not None:
+        query += f" LIMIT {int(limit)}"
+    df = pd.read_sql_query(query, conn)
+    return df
+
+@instrumented()
+def get_table_schema(conn, table_name, source='sqlite', cached=True, schema=''):
+    """
+    Returns the column definitions of a table. On Snowflake the table is looked
+    up in `schema`, by default the connection's current schema, so same-named
+    tables in other schemas are never mixed in.
+    """
+    schema = _schema_name(conn, source, schema)
+    if not cached:
+        return _load_table_schema(conn, table_name, source, schema)
+    key = (connection_identity(conn, source), 'schema', schema, table_name.lower())
+    return metadata_cache.get_or_load(key, lambda: _load_table_schema(conn, table_name, source, schema))
+
+def _schema_name(conn, source, schema):
+    # Upper-cased Snowflake schema of a lookup (the current one when not given); SQLite has none
+    if source == 'snowflake':
+        return (schema or get_current_schema(conn)).upper()
+    return ''
+
+def _load_table_schema(conn, table_name, source, schema):
     if source == 'sqlite':
         query = f"PRAGMA table_info({table_name});"
         schema = pd.read_sql_query(query, conn)
@@ -24,7 +172,7 @@ def get_table_schema(conn, table_name, source='sqlite'):
         query = f"""
         SELECT column_name, data_type, is_nullable
         FROM information_schema.columns
-        WHERE table_name = '{table_name.upper()}'
+        WHERE table_schema = '{schema}' AND table_name = '{table_name.upper()}'
         ORDER BY ordinal_position;
         """
         schema = pd.read_sql_query(query, conn)
@@ -32,16 +180,39 @@ def get_table_schema(conn, table_name, source='sqlite'):
     else:
         raise ValueError("Unsupported source type.")
 
+@instrumented(backend='snowflake')
 def get_snowflake_schemas(conn):
     """
     Returns a list of available schemas in the connected Snowflake database.
     """
+    key = (connection_identity(conn, 'snowflake'), 'schemas', '')
+    return metadata_cache.get_or_load(key, lambda: _load_snowflake_schemas(conn))
+
+def _load_snowflake_schemas(conn):
     query = "SELECT schema_name FROM information_schema.schemata"
     df = pd.read_sql_query(query, conn)
     return sorted(df['SCHEMA_NAME'].tolist())
 
+@instrumented(backend='snowflake')
+def get_current_schema(conn):
+    """
+    Returns the schema the Snowflake connection was configured with, or its
+    current schema when none was, upper-cased.
+    """
+    schema = getattr(conn, 'schema', None)
+    if not schema:
+        cur = conn.cursor()
+        cur.execute("SELECT CURRENT_SCHEMA()")
+        schema = cur.fetchone()[0]
+    return (schema or '').upper()
+
 
+@instrumented()
 def get_table_list(conn, source='sqlite', schema=''):
+    key = (connection_identity(conn, source), 'tables', schema.upper())
+    return metadata_cache.get_or_load(key, lambda: _load_table_list(conn, source, schema))
+
+def _load_table_list(conn, source, schema):
     if source == 'sqlite':
         query = "SELECT name FROM sqlite_master WHERE type='table';"
         df = pd.read_sql_query(query, conn)
@@ -53,4 +224,280 @@ def get_table_list(conn, source='sqlite', schema=''):
         WHERE table_schema = '{schema.upper()}'
         """
         df = pd.read_sql_query(query, conn)
-        return df['NAME'].tolist()
\ No newline at end of file
+        return df['NAME'].tolist()
+
+
+@instrumented()
+def get_column_types(conn, table_name, source='sqlite', cached=True, schema=''):
+    """
+    Returns (column name, data type) pairs for a table in ordinal order.
+    """
+    columns = get_table_schema(conn, table_name, source=source, cached=cached, schema=schema)
+    if source == 'sqlite':
+        return list(zip(columns['name'], columns['type']))
+    return list(zip(columns['COLUMN_NAME'], columns['DATA_TYPE']))
+
+
+@instrumented()
+def get_column_names(conn, table_name, source='sqlite', schema=''):
+    """
+    Returns the column names of a table in ordinal order.
+    """
+    return [name for name, _ in get_column_types(conn, table_name, source=source, schema=schema)]
+
+
+@instrumented()
+def get_primary_key(conn, table_name, source='sqlite'):
+    """
+    Returns the primary key column of a table. Snowflake does not enforce primary
+    keys, so the first column is used there (CustomerID, AccountID, ...).
+    """
+    if source == 'sqlite':
+        schema = pd.read_sql_query(f"PRAGMA table_info({table_name});", conn)
+        pk = schema[schema['pk'] > 0].sort_values('pk')
+        if not pk.empty:
+            return pk['name'].iloc[0]
+    return get_column_names(conn, table_name, source=source)[0]
+
+
+@instrumented()
+def iter_table_chunks(conn, table_name, chunksize=50000, source='sqlite', where=None, order_by=None):
+    """
+    Yields the rows of a table as DataFrames of at most `chunksize` rows, so a
+    whole table can be checked without holding it in memory.
+    """
+    query = f"SELECT * FROM {table_name}"
+    if where:
+        query += f" WHERE {where}"
+    if order_by:
+        query += f" ORDER BY {order_by}"
+    for chunk in pd.read_sql_query(query, conn, chunksize=chunksize):
+        yield chunk
+
+
+@instrumented()
+def get_all_table_schemas(conn, source='sqlite', schema=''):
+    """
+    Returns {table name (lower case): column definitions} for every table, with
+    the same columns get_table_schema returns, using a single query.
+    """
+    identity = connection_identity(conn, source)
+    schemas = metadata_cache.get_or_load(
+        (identity, 'all_schemas', schema.upper()),
+        lambda: _load_all_table_schemas(conn, source, schema)
+    )
+    # Seed the per-table entries so later get_table_schema calls are cache hits
+    schema_name = schema.upper() if source == 'snowflake' else ''
+    for table_name, table_schema in schemas.items():
+        metadata_cache.put((identity, 'schema', schema_name, table_name.lower()), table_schema)
+    return schemas
+
+def _load_all_table_schemas(conn, source, schema):
+    if source == 'sqlite':
+        query = """
+        SELECT LOWER(m.name) AS table_name, p.name, p.type, p."notnull", p.dflt_value
+        FROM sqlite_master m
+        JOIN pragma_table_info(m.name) p
+        WHERE m.type = 'table' AND m.name NOT LIKE 'sqlite_%'
+        ORDER BY m.name, p.cid;
+        """
+        df = pd.read_sql_query(query, conn)
+        key = 'table_name'
+    elif source == 'snowflake':
+        query = f"""
+        SELECT LOWER(table_name) AS table_name, column_name, data_type, is_nullable
+        FROM information_schema.columns
+        WHERE table_schema = '{schema.upper()}'
+        ORDER BY table_name, ordinal_position;
+        """
+        df = pd.read_sql_query(query, conn)
+        key = 'TABLE_NAME'
+    else:
+        raise ValueError("Unsupported source type.")
+    return {
+        table_name: group.drop(columns=key).reset_index(drop=True)
+        for table_name, group in df.groupby(key, sort=False)
+    }
+
+
+@instrumented()
+def get_all_row_counts(conn, source='sqlite', schema=''):
+    """
+    Returns {table name (lower case): row count} for every table in one query.
+    On Snowflake this reads ROW_COUNT from information_schema.tables, which is
+    maintained by the warehouse and does not scan the tables.
+    """
+    if source == 'sqlite':
+        tables = [t for t in get_table_list(conn, source='sqlite') if not t.startswith('sqlite_')]
+        if not tables:
+            return {}
+        query = " UNION ALL ".join(f"SELECT '{t.lower()}', COUNT(*) FROM {t}" for t in tables)
+    elif source == 'snowflake':
+        query = f"""
+        SELECT LOWER(table_name), row_count
+        FROM information_schema.tables
+        WHERE table_schema = '{schema.upper()}' AND table_type = 'BASE TABLE'
+        """
+    else:
+        raise ValueError("Unsupported source type.")
+    cur = conn.cursor()
+    cur.execute(query)
+    return {table_name: int(count) for table_name, count in cur.fetchall()}
+
+
+@instrumented()
+def get_table_versions(conn, source='sqlite', schema=''):
+    """
+    Returns {table name (lower case): change fingerprint} for every table in
+    one metadata query per side. The fingerprint changes whenever the table's
+    data may have changed, so results computed from a table can be reused (or
+    a re-check skipped) while it stays the same.
+
+    Snowflake: LAST_ALTERED, ROW_COUNT and BYTES from information_schema.tables.
+    SQLite: the schema version plus the size and modification time of the
+    database file and its WAL, which every committed write changes; no table
+    is scanned. PRAGMA data_version can't be used, since its value is only
+    comparable within one connection; and as SQLite has no per-table change
+    marker, a write to any table changes the fingerprint of every table.
+    Tables of a database whose changes can't be detected (e.g. in-memory
+    SQLite) are left out.
+    """
+    if source == 'sqlite':
+        path = connection_identity(conn, 'sqlite')[len("sqlite:"):]
+        if not path or not os.path.exists(path):
+            return {}
+        file_version = ":".join(
+            f"{st.st_size}.{st.st_mtime_ns}"
+            for st in (os.stat(p) for p in (path, path + "-wal") if os.path.exists(p))
+        )
+        schema_version = conn.execute("PRAGMA schema_version").fetchone()[0]
+        tables = conn.execute(
+            "SELECT name FROM sqlite_master WHERE type = 'table' AND name NOT LIKE 'sqlite_%'"
+        ).fetchall()
+        return {name.lower(): f"{file_version}/{schema_version}" for name, in tables}
+    elif source == 'snowflake':
+        query = f"""
+        SELECT LOWER(table_name), TO_VARCHAR(last_altered) || '/' || row_count || '/' || bytes
+        FROM information_schema.tables
+        WHERE table_schema = '{schema.upper()}' AND table_type = 'BASE TABLE'
+        """
+    else:
+        raise ValueError("Unsupported source type.")
+    cur = conn.cursor()
+    cur.execute(query)
+    return dict(cur.fetchall())
+
+@instrumented()
+def iter_arrow_batches(conn, query, source='sqlite', batch_size=65536):
+    """
+    Yields the result of a query as Arrow record batches (or tables) without
+    going through pandas object columns. Snowflake streams its native Arrow
+    result chunks. SQLite files are read by the ADBC SQLite driver when
+    adbc-driver-sqlite is installed, which builds the columns natively; without
+    it (or for in-memory databases, queries it cannot run, e.g. ones using
+    functions registered on `conn`, and the rest of a result once a column
+    mixes storage classes) rows are fetched `batch_size` at a time and
+    converted column by column, which is no faster than pandas.
+    """
+    import pyarrow as pa
+
+    done = 0
+    if source == 'sqlite':
+        batches = _adbc_sqlite_batches(conn, query, batch_size)
+        if batches is not None:
+            try:
+                for batch in batches:
+                    yield batch
+                    done += batch.num_rows
+                return
+            except Exception:
+                # ADBC types each column from the first batch and stops at a value of another
+                # storage class; carry on with the rows after those already yielded
+                pass
+    elif source != 'snowflake':
+        raise ValueError("Unsupported source type.")
+    cur = conn.cursor()
+    cur.execute(query)
+    if source == 'snowflake':
+        yield from cur.fetch_arrow_batches()
+    else:
+        names = [d[0] for d in cur.description]
+        while done > 0:
+            done -= len(cur.fetchmany(min(done, batch_size)))
+        while True:
+            rows = cur.fetchmany(batch_size)
+            if not rows:
+                break
+            yield pa.RecordBatch.from_arrays([_arrow_column(column) for column in zip(*rows)], names=names)
+
+
+def _adbc_sqlite_batches(conn, query, batch_size):
+    """
+    Runs the query on the same SQLite file through ADBC and returns an
+    iterator of its record batches, or None when the driver is not installed,
+    the database is not a file or the query fails. The ADBC connection sees
+    committed data only.
+    """
+    try:
+        import adbc_driver_sqlite.dbapi as adbc_sqlite
+    except ImportError:
+        return None
+    path = connection_identity(conn, 'sqlite')[len("sqlite:"):]
+    if not path:
+        return None
+    adbc_conn = adbc_sqlite.connect(path)
+    try:
+        cur = adbc_conn.cursor()
+        cur.adbc_statement.set_options(**{'adbc.sqlite.query.batch_rows': str(batch_size)})
+        cur.execute(query)
+        reader = cur.fetch_record_batch()
+    except Exception:
+        adbc_conn.close()
+        return None
+
+    def batches():
+        # The reader is only valid while its cursor is open
+        try:
+            yield from reader
+        finally:
+            cur.close()
+            adbc_conn.close()
+    return batches()
+
+
+def _arrow_column(values):
+    import pyarrow as pa
+
+    try:
+        return pa.array(values)
+    except (pa.ArrowInvalid, pa.ArrowTypeError):
+        # SQLite columns can mix storage classes; fall back to text
+        return pa.array([None if v is None else str(v) for v in values], type=pa.string())
+
+
+@instrumented()
+def fetch_arrow(conn, query, source='sqlite', batch_size=65536):
+    """
+    Returns the whole result of a query as one Arrow table.
+    """
+    import pyarrow as pa
+
+    tables = [pa.Table.from_batches([b]) if isinstance(b, pa.RecordBatch) else b
+              for b in iter_arrow_batches(conn, query, source=source, batch_size=batch_size)]
+    if not tables:
+        cur = conn.cursor()
+        cur.execute(query)
+        return pa.table({d[0]: pa.array([], type=pa.null()) for d in cur.description})
+    # Batches where a column was all NULL have a null (or, from ADBC, int64) type; promote them
+    return pa.concat_tables(tables, promote_options='permissive')
+
+
+@instrumented()
+def get_sample_arrow(conn, table_name, n=20, source='sqlite'):
+    return fetch_arrow(conn, f"SELECT * FROM {table_name} LIMIT {n}", source=source)
+
+
+@instrumented('compute')
+def arrow_to_frame(table):
+    # DataFrame backed by the Arrow buffers (ArrowDtype columns), no object copies
+    return table.to_pandas(types_mapper=pd.ArrowDtype)
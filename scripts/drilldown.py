@@ -0,0 +1,236 @@
+"""
+Drill-down into the rows behind a row diff (comparator.diff_tables) and
+streaming export of mismatched or sampled rows.
+
+The drill-down pages through the sorted mismatched keys with keyset
+pagination and fetches only the rows of the visible page from each side.
+Exports fetch and write a chunk at a time, so neither needs the mismatched
+rows in memory all at once.
+"""
+import os
+
+import numpy as np
+import pandas as pd
+
+from scripts import data_fetcher, profiler
+from scripts.instrumentation import instrumented
+
+DIFF_KINDS = ('added', 'deleted', 'changed')
+# Side(s) holding the rows of each kind of difference
+DIFF_SIDES = {'added': ('target',), 'deleted': ('source',), 'changed': ('source', 'target')}
+DEFAULT_EXPORT_DIR = os.path.join(os.path.dirname(__file__), "..", "data", "exports")
+
+
+def mismatch_keys(diff):
+    # The sorted key lists of a diff as int64 arrays (8 bytes a key), compact enough to keep in a session
+    return {kind: np.asarray(diff[kind], dtype=np.int64) for kind in DIFF_KINDS}
+
+
+def next_page(keys, after=None, page_size=50):
+    """
+    Keyset pagination over a sorted key array: returns up to `page_size` keys
+    greater than `after` (the last key of the previous page, None for the first).
+    """
+    start = 0 if after is None else int(np.searchsorted(keys, after, side='right'))
+    return keys[start:start + page_size]
+
+
+@instrumented()
+def fetch_rows_by_key(conn, table_name, key_column, keys, source='sqlite'):
+    """
+    Returns only the rows with the given integer primary keys, ordered by key.
+    """
+    if source not in ('sqlite', 'snowflake'):
+        raise ValueError("Unsupported source type.")
+    where = f"{key_column} IN ({', '.join(str(int(k)) for k in keys)})" if len(keys) else "1 = 0"
+    return pd.read_sql_query(f"SELECT * FROM {table_name} WHERE {where} ORDER BY {key_column}", conn)
+
+
+def page_rows(conn_source, conn_target, table_name, key_column, keys, kind, source='sqlite', target='snowflake'):
+    """
+    Returns the rows of `keys` from the side(s) holding that kind of
+    difference, with _DIFF and _SIDE columns and upper-case column names, so a
+    changed row's source and target versions are next to each other.
+    """
+    conns = {'source': (conn_source, source), 'target': (conn_target, target)}
+    frames = []
+    for side in DIFF_SIDES[kind]:
+        conn, side_source = conns[side]
+        frame = fetch_rows_by_key(conn, table_name, key_column, keys, source=side_source).rename(columns=str.upper)
+        frame.insert(0, '_SIDE', side)
+        frame.insert(0, '_DIFF', kind)
+        frames.append(frame)
+    rows = pd.concat(frames, ignore_index=True)
+    return rows.sort_values([key_column.upper(), '_SIDE'], kind='stable', ignore_index=True)
+
+
+def _column_kind(data_type):
+    # 'integer', 'float' or 'text', from a declared SQLite or Snowflake column type
+    if not profiler.is_numeric_type(data_type):
+        return 'text'
+    return 'integer' if 'INT' in (data_type or '').upper() else 'float'
+
+
+def export_columns(conn_source, conn_target, table_name, source='sqlite', target='snowflake'):
+    """
+    Returns (column, kind) pairs for every column of either side, upper-cased,
+    so all exported chunks share one layout and one set of types whichever
+    side a chunk came from. A column declared differently on the two sides
+    is exported as float if both are numeric and as text otherwise.
+    """
+    kinds = {'_DIFF': 'text', '_SIDE': 'text'}
+    for conn, side_source in ((conn_source, source), (conn_target, target)):
+        for name, data_type in data_fetcher.get_column_types(conn, table_name, source=side_source):
+            name, kind = name.upper(), _column_kind(data_type)
+            if name in kinds and kinds[name] != kind:
+                kind = 'float' if 'text' not in (kinds[name], kind) else 'text'
+            kinds[name] = kind
+    return list(kinds.items())
+
+
+def _arrow_schema(columns):
+    import pyarrow as pa
+
+    types = {'integer': pa.int64(), 'float': pa.float64(), 'text': pa.string()}
+    return pa.schema([(name, types[kind]) for name, kind in columns])
+
+
+def _arrow_column(series, field):
+    import pyarrow as pa
+
+    # Text columns may hold numbers (SQLite is dynamically typed) or only NULLs
+    if pa.types.is_string(field.type):
+        return pa.array(series.astype('string'), type=field.type)
+    try:
+        return pa.array(series, type=field.type, from_pandas=True)
+    except (pa.ArrowInvalid, pa.ArrowTypeError):
+        # A value the declared type cannot hold exactly, e.g. 1.5 in an INT column:
+        # write it as float (or text) rather than truncate it
+        if pa.types.is_integer(field.type):
+            try:
+                return pa.array(series, type=pa.float64(), from_pandas=True)
+            except (pa.ArrowInvalid, pa.ArrowTypeError):
+                pass
+        return pa.array(series.astype('string'), type=pa.string())
+
+
+def _arrow_table(frame, schema):
+    # Columns keep the schema's types unless a value needed a wider one (see _arrow_column)
+    import pyarrow as pa
+
+    arrays = [_arrow_column(frame[field.name], field) for field in schema]
+    return pa.Table.from_arrays(arrays, schema=pa.schema([(f.name, a.type) for f, a in zip(schema, arrays)]))
+
+
+def _widen(schema, other):
+    # Per column, the schema's type if both agree, else float64 for two numeric types and text otherwise
+    import pyarrow as pa
+
+    fields = []
+    for field, other_field in zip(schema, other):
+        kind = field.type
+        if kind != other_field.type:
+            numeric = all(pa.types.is_integer(t) or pa.types.is_floating(t) for t in (kind, other_field.type))
+            kind = pa.float64() if numeric else pa.string()
+        fields.append((field.name, kind))
+    return pa.schema(fields)
+
+
+@instrumented('compute')
+def write_frames(frames, path, columns):
+    """
+    Writes an iterator of DataFrames to a Parquet or CSV file (by extension),
+    one chunk at a time, with the given (column, kind) pairs (see
+    export_columns). A Parquet column holding values its declared type
+    cannot store exactly is widened to float or text instead of truncated.
+    Returns the rows written.
+    """
+    os.makedirs(os.path.dirname(os.path.abspath(path)), exist_ok=True)
+    parquet = path.lower().endswith('.parquet')
+    names = [name for name, _ in columns]
+    writer = None
+    rows = 0
+    try:
+        if parquet:
+            import pyarrow.parquet as pq
+
+            schema = _arrow_schema(columns)
+            writer = pq.ParquetWriter(path, schema)
+        for frame in frames:
+            frame = frame.reindex(columns=names)
+            if parquet:
+                table = _arrow_table(frame, schema)
+                if table.schema != schema:
+                    # A column needs a wider type than declared: rewrite what was written with it.
+                    # Parquet files have one schema, so this reads the part written so far back in.
+                    schema = _widen(schema, table.schema)
+                    writer.close()
+                    written = pq.read_table(path).cast(schema)
+                    writer = pq.ParquetWriter(path, schema)
+                    writer.write_table(written)
+                    table = table.cast(schema)
+                writer.write_table(table)
+            else:
+                frame.to_csv(path, mode='w' if rows == 0 else 'a', header=rows == 0, index=False)
+            rows += len(frame)
+    finally:
+        if writer is not None:
+            writer.close()
+    if rows == 0 and not parquet:
+        # Nothing was written; still leave a file with the header
+        pd.DataFrame(columns=names).to_csv(path, index=False)
+    return rows
+
+
+def iter_mismatched_rows(conn_source, conn_target, table_name, key_column, keys_by_kind,
+                         source='sqlite', target='snowflake', chunksize=5000):
+    """
+    Yields the rows of every mismatched key (see mismatch_keys), `chunksize`
+    keys per query and side.
+    """
+    for kind in DIFF_KINDS:
+        keys = keys_by_kind[kind]
+        for start in range(0, len(keys), chunksize):
+            yield page_rows(conn_source, conn_target, table_name, key_column, keys[start:start + chunksize], kind,
+                            source=source, target=target)
+
+
+def export_mismatches(conn_source, conn_target, table_name, key_column, keys_by_kind, path,
+                      source='sqlite', target='snowflake', chunksize=5000):
+    """
+    Streams the mismatched rows of both sides to a Parquet or CSV file.
+    Returns the number of rows written.
+    """
+    columns = export_columns(conn_source, conn_target, table_name, source=source, target=target)
+    frames = iter_mismatched_rows(conn_source, conn_target, table_name, key_column, keys_by_kind,
+                                  source=source, target=target, chunksize=chunksize)
+    return write_frames(frames, path, columns)
+
+
+def iter_sample_rows(conn_source, conn_target, table_name, key_column, rate,
+                     source='sqlite', target='snowflake', chunksize=50000):
+    """
+    Yields the hash-sampled rows (see data_fetcher.get_key_sample) of the
+    source and then the target, in chunks, with a _SIDE column.
+    """
+    for side, conn, side_source in (('source', conn_source, source), ('target', conn_target, target)):
+        where = data_fetcher.key_sample_filter(conn, key_column, rate, source=side_source)
+        for chunk in data_fetcher.iter_table_chunks(conn, table_name, chunksize=chunksize, source=side_source,
+                                                    where=where, order_by=key_column):
+            chunk = chunk.rename(columns=str.upper)
+            chunk.insert(0, '_SIDE', side)
+            yield chunk
+
+
+def export_sample(conn_source, conn_target, table_name, key_column, rate, path,
+                  source='sqlite', target='snowflake', chunksize=50000):
+    """
+    Streams the same hash sample of both sides to a Parquet or CSV file.
+    Returns the number of rows written.
+    """
+    # Sampled rows are not differences, so they have no _DIFF column
+    columns = [(name, kind) for name, kind in export_columns(conn_source, conn_target, table_name,
+                                                             source=source, target=target) if name != '_DIFF']
+    frames = iter_sample_rows(conn_source, conn_target, table_name, key_column, rate,
+                              source=source, target=target, chunksize=chunksize)
+    return write_frames(frames, path, columns)
@@ -0,0 +1,83 @@
+import contextvars
+import os
+import threading
+from concurrent.futures import ThreadPoolExecutor
+
+from config import connection_pool
+
+
+class ComparisonExecutor:
+    """
+    Runs database steps concurrently, each on its own pooled connection.
+
+    Every task names the pool it needs; a semaphore per pool caps how many of
+    its tasks run at once (by default the pool size), so a slow warehouse can't
+    take every worker thread from the other backend.
+    """
+
+    def __init__(self, max_workers=8, limits=None):
+        self._executor = ThreadPoolExecutor(max_workers=max_workers, thread_name_prefix='dq-compare')
+        self._limits = dict(limits or {})
+        self._semaphores = {}
+        self._lock = threading.Lock()
+
+    def _semaphore(self, pool_name):
+        with self._lock:
+            if pool_name not in self._semaphores:
+                limit = self._limits.get(pool_name) or connection_pool.get_pool(pool_name).max_size
+                self._semaphores[pool_name] = threading.BoundedSemaphore(limit)
+            return self._semaphores[pool_name]
+
+    def _run(self, pool_name, fn, args, kwargs):
+        with self._semaphore(pool_name):
+            with connection_pool.get_pool(pool_name).connection() as conn:
+                return fn(conn, *args, **kwargs)
+
+    def submit(self, pool_name, fn, *args, **kwargs):
+        """
+        Schedules fn(conn, *args, **kwargs) on a connection from `pool_name`
+        and returns its Future.
+        """
+        # Run in a copy of the caller's context so instrumentation tags follow the task
+        context = contextvars.copy_context()
+        return self._executor.submit(context.run, self._run, pool_name, fn, args, kwargs)
+
+    def submit_pair(self, fn, source, target, *args, **kwargs):
+        """
+        Schedules the same step on both sides at once. `source` and `target` are
+        (pool name, source type) pairs; the source type is passed as `source=`.
+        Returns the (source future, target future) pair.
+        """
+        return (
+            self.submit(source[0], fn, *args, source=source[1], **kwargs),
+            self.submit(target[0], fn, *args, source=target[1], **kwargs),
+        )
+
+    def shutdown(self, wait=True):
+        self._executor.shutdown(wait=wait)
+
+
+_executor = None
+_executor_lock = threading.Lock()
+
+
+def get_executor():
+    """
+    Returns the process-wide executor shared by every Streamlit session.
+    Per-pool limits come from DQ_<POOL>_CONCURRENCY, e.g. DQ_SNOWFLAKE_CONCURRENCY.
+    """
+    global _executor
+    with _executor_lock:
+        if _executor is None:
+            limits = {
+                name: int(os.environ[f"DQ_{name.upper()}_CONCURRENCY"])
+                for name in ('sqlite', 'snowflake') if f"DQ_{name.upper()}_CONCURRENCY" in os.environ
+            }
+            _executor = ComparisonExecutor(max_workers=int(os.environ.get("DQ_EXECUTOR_WORKERS", 8)),
+                                           limits=limits)
+        return _executor
+
+
+def results(*futures):
+    # Waits for all futures and returns their results in order
+    return [f.result() for f in futures]
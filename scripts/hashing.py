@@ -0,0 +1,51 @@
+import hashlib
+import math
+
+# Row hashes are reduced to 32 bits so that SUM() over a whole table fits
+# comfortably in a signed 64-bit integer on both databases.
+HASH_MODULUS = 4294967296
+NULL_TOKEN = "<null>"
+
+
+def normalize_value(value):
+    """
+    Returns the text form of a value the same way Snowflake's TO_VARCHAR does,
+    so that both sides hash identical strings.
+    """
+    if value is None or (isinstance(value, float) and math.isnan(value)):
+        return NULL_TOKEN
+    if isinstance(value, float) and value.is_integer():
+        return str(int(value))
+    if isinstance(value, bytes):
+        return value.hex()
+    return str(value)
+
+
+def hash_values(*values):
+    # Lower 64 bits of the MD5 digest (same as MD5_NUMBER_LOWER64), reduced to 32 bits
+    text = "|".join(normalize_value(v) for v in values)
+    digest = hashlib.md5(text.encode("utf-8")).hexdigest()
+    return int(digest[16:], 16) % HASH_MODULUS
+
+
+def prepare_connection(conn, source='sqlite'):
+    """
+    Registers the helper SQL functions SQLite needs to compute hashes in-database.
+    Snowflake has MD5_NUMBER_LOWER64 built in, so nothing is registered there.
+    """
+    if source == 'sqlite':
+        conn.create_function("dq_hash", -1, hash_values, deterministic=True)
+    return conn
+
+
+def sql_row_hash(columns, source='sqlite'):
+    """
+    Returns a SQL expression computing the 32-bit hash of the given columns.
+    """
+    if source == 'sqlite':
+        return f"dq_hash({', '.join(columns)})"
+    elif source == 'snowflake':
+        parts = ", ".join(f"COALESCE(TO_VARCHAR({c}), '{NULL_TOKEN}')" for c in columns)
+        return f"MOD(MD5_NUMBER_LOWER64(CONCAT_WS('|', {parts})), {HASH_MODULUS})"
+    else:
+        raise ValueError("Unsupported source type.")
@@ -0,0 +1,184 @@
+import json
+import os
+import sqlite3
+import time
+
+import numpy as np
+import pandas as pd
+
+from scripts import data_fetcher, quality_checks
+
+DEFAULT_STATE_PATH = os.path.join(os.path.dirname(__file__), "..", "data", "check_state.sqlite")
+
+
+class IncrementalStateStore:
+    """
+    Local SQLite file holding, per backend and table, the high-water mark of the
+    primary key plus the running check aggregates (row count, null counts,
+    numeric sums and the sorted duplicate-hash array).
+    """
+
+    def __init__(self, path=DEFAULT_STATE_PATH):
+        self.path = path
+        with self._connect() as conn:
+            conn.execute("""
+            CREATE TABLE IF NOT EXISTS incremental_state (
+                backend TEXT NOT NULL,
+                table_name TEXT NOT NULL,
+                key_column TEXT NOT NULL,
+                watermark TEXT,
+                schema_signature TEXT NOT NULL,
+                row_count INTEGER NOT NULL,
+                duplicate_count INTEGER NOT NULL,
+                null_counts TEXT NOT NULL,
+                numeric TEXT NOT NULL,
+                row_hashes BLOB NOT NULL,
+                updated_at TEXT NOT NULL,
+                PRIMARY KEY (backend, table_name)
+            );
+            """)
+
+    def _connect(self):
+        return sqlite3.connect(self.path, timeout=30)
+
+    def load(self, backend, table_name):
+        """
+        Returns (checks, watermark, key column, schema signature), or None when
+        the table has never been checked.
+        """
+        with self._connect() as conn:
+            row = conn.execute("""
+            SELECT key_column, watermark, schema_signature, row_count, duplicate_count,
+                   null_counts, numeric, row_hashes
+            FROM incremental_state WHERE backend = ? AND table_name = ?
+            """, (backend, table_name.lower())).fetchone()
+        if row is None:
+            return None
+        key_column, watermark, signature, row_count, duplicate_count, null_counts, numeric, row_hashes = row
+        checks = quality_checks.ChunkedChecks()
+        checks.row_count = row_count
+        checks.duplicate_count = duplicate_count
+        checks.null_counts = pd.Series(json.loads(null_counts), dtype='int64')
+        checks.numeric = pd.DataFrame(json.loads(numeric), index=checks.numeric.index, dtype='float64')
+        checks.row_hashes = np.frombuffer(row_hashes, dtype=np.uint64).copy()
+        return checks, json.loads(watermark), key_column, signature
+
+    def save(self, backend, table_name, key_column, watermark, signature, checks):
+        with self._connect() as conn:
+            conn.execute("""
+            INSERT OR REPLACE INTO incremental_state VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?)
+            """, (
+                backend, table_name.lower(), key_column, json.dumps(watermark), signature,
+                int(checks.row_count), int(checks.duplicate_count),
+                json.dumps({k: int(v) for k, v in checks.null_counts.items()}),
+                json.dumps({c: [float(v) for v in checks.numeric[c]] for c in checks.numeric.columns}),
+                checks.row_hashes.astype(np.uint64).tobytes(),
+                time.strftime('%Y-%m-%dT%H:%M:%S'),
+            ))
+
+    def clear(self, backend=None, table_name=None):
+        query = "DELETE FROM incremental_state WHERE 1 = 1"
+        params = []
+        if backend is not None:
+            query += " AND backend = ?"
+            params.append(backend)
+        if table_name is not None:
+            query += " AND table_name = ?"
+            params.append(table_name.lower())
+        with self._connect() as conn:
+            conn.execute(query, params)
+
+
+def _literal(value):
+    if isinstance(value, str):
+        return "'" + value.replace("'", "''") + "'"
+    return str(value)
+
+
+def _column(chunk, name):
+    # Snowflake returns upper-case column names
+    lookup = {c.lower(): c for c in chunk.columns}
+    return chunk[lookup[name.lower()]]
+
+
+def _count_up_to(conn, table_name, key_column, watermark):
+    # Rows already checked: those at or below the watermark plus those without a key,
+    # which every full scan includes and no incremental scan can pick out
+    cur = conn.cursor()
+    cur.execute(f"SELECT COUNT(*) FROM {table_name} "
+                f"WHERE {key_column} <= {_literal(watermark)} OR {key_column} IS NULL")
+    return int(cur.fetchone()[0])
+
+
+def _state_backend(conn, source, schema=None):
+    # Same-named tables in different Snowflake schemas keep separate state
+    backend = data_fetcher.connection_identity(conn, source)
+    if source == 'snowflake':
+        backend += "/" + (schema or getattr(conn, 'schema', None) or '').upper()
+    return backend
+
+
+def run_incremental_checks(conn, table_name, key_column, source='sqlite', store=None,
+                           chunksize=50000, force_full=False, schema=None):
+    """
+    Runs the chunked checks on only the rows whose key is above the stored
+    high-water mark and merges them into the stored aggregates.
+
+    Falls back to a full rescan when there is no state yet, when the column
+    definitions changed, or when the number of rows at or below the watermark
+    differs from the stored row count (rows were deleted or back-filled, or
+    rows without a key were added). In-place updates of already-checked rows
+    are not detected; pass force_full=True to rebuild the state after such
+    loads. State is kept per database and, on Snowflake, per `schema`
+    (default: the connection's current schema).
+
+    Returns (checks, info) where info has the 'mode' (full or incremental),
+    'rows_scanned' and the new 'watermark'.
+    """
+    store = store or IncrementalStateStore()
+    backend = _state_backend(conn, source, schema)
+    # State saved with another row-hash scheme cannot be extended, so the scheme is part of the signature
+    signature = json.dumps([quality_checks.ROW_HASH_VERSION,
+                            data_fetcher.get_column_types(conn, table_name, source=source, cached=False)])
+
+    state = None if force_full else store.load(backend, table_name)
+    watermark = None
+    if state is not None:
+        checks, watermark, stored_key, stored_signature = state
+        if stored_key.lower() != key_column.lower() or stored_signature != signature:
+            state = None
+        elif watermark is not None and _count_up_to(conn, table_name, key_column, watermark) != checks.row_count:
+            state = None
+
+    if state is None:
+        checks, watermark, mode, where = quality_checks.ChunkedChecks(), None, 'full', None
+    else:
+        mode = 'incremental'
+        where = f"{key_column} > {_literal(watermark)}" if watermark is not None else None
+
+    rows_scanned = 0
+    for chunk in data_fetcher.iter_table_chunks(conn, table_name, chunksize=chunksize, source=source,
+                                                where=where, order_by=key_column):
+        if chunk.empty:
+            continue
+        checks.update(chunk)
+        rows_scanned += len(chunk)
+        chunk_max = _column(chunk, key_column).max()
+        watermark = chunk_max.item() if hasattr(chunk_max, 'item') else chunk_max
+
+    store.save(backend, table_name, key_column, watermark, signature, checks)
+    return checks, {'mode': mode, 'rows_scanned': rows_scanned, 'watermark': watermark}
+
+
+def incremental_profile(conn, table_name, key_column, source='sqlite', store=None, schema=None):
+    """
+    Same shape as profiler.profile_table, computed incrementally.
+    """
+    checks, info = run_incremental_checks(conn, table_name, key_column, source=source, store=store, schema=schema)
+    return {
+        'row_count': checks.row_count,
+        'nulls': checks.nulls(),
+        'duplicates': checks.duplicates(),
+        'stats': checks.stats(),
+        'incremental': info,
+    }
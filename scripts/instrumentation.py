@@ -0,0 +1,299 @@
+"""
+Timing and size instrumentation for data_fetcher and quality_checks.
+
+Every decorated call produces one event dict:
+
+    name, kind ('query' for database round trips, 'compute' for pandas/numpy
+    work), backend, table, seconds, self_seconds (excluding nested
+    instrumented calls), rows, bytes, peak_memory, depth, error, started_at
+    and any tags set with set_tags().
+
+Events are passed to every registered hook (add_hook) and kept in a bounded
+in-memory buffer for the app's Performance panel. Peak memory is the
+tracemalloc peak above the allocation level at call start; it is only
+measured while tracemalloc is tracing (enable_memory_tracking() or
+DQ_TRACE_MEMORY=1), since tracing slows Python allocations down noticeably.
+The tracemalloc peak is process-wide, so a call that overlapped an
+instrumented call on another thread (e.g. both sides of a step on the
+ComparisonExecutor) records peak_memory None rather than a wrong value.
+"""
+import contextvars
+import functools
+import inspect
+import json
+import logging
+import os
+import threading
+import time
+import tracemalloc
+from collections import deque
+
+import pandas as pd
+
+logger = logging.getLogger("dq.instrumentation")
+
+_hooks = []
+_events = deque(maxlen=int(os.environ.get("DQ_INSTRUMENTATION_BUFFER", 5000)))
+_events_lock = threading.Lock()
+_tags = contextvars.ContextVar('dq_instrumentation_tags', default={})
+_local = threading.local()
+# Threads with instrumented calls in progress while tracing memory (thread id -> depth),
+# and a counter bumped whenever calls on two threads overlap
+_memory_lock = threading.Lock()
+_memory_threads = {}
+_memory_overlaps = 0
+
+
+def add_hook(hook):
+    """
+    Registers hook(event) to be called after every instrumented call, e.g. to
+    export events to a metrics pipeline. Exceptions raised by hooks are logged
+    and otherwise ignored.
+    """
+    _hooks.append(hook)
+    return hook
+
+
+def remove_hook(hook):
+    _hooks.remove(hook)
+
+
+def set_tags(**tags):
+    """
+    Adds tags to every event recorded in the current context (thread or
+    Streamlit run), e.g. set_tags(run=run_id). Returns a token for reset_tags.
+    """
+    return _tags.set({**_tags.get(), **tags})
+
+
+def reset_tags(token):
+    _tags.reset(token)
+
+
+def enable_memory_tracking():
+    if not tracemalloc.is_tracing():
+        tracemalloc.start()
+
+
+def _log_hook(event):
+    if logger.isEnabledFor(logging.INFO):
+        logger.info(json.dumps(event, default=str))
+
+
+def events(**tags):
+    """
+    Returns the buffered events (oldest first) whose tags match `tags`.
+    """
+    with _events_lock:
+        recorded = list(_events)
+    return [e for e in recorded if all(e.get(k) == v for k, v in tags.items())]
+
+
+def events_frame(**tags):
+    columns = ['name', 'kind', 'backend', 'table', 'seconds', 'self_seconds', 'rows', 'bytes',
+               'peak_memory', 'depth', 'error']
+    return pd.DataFrame(events(**tags), columns=columns)
+
+
+def summary(**tags):
+    """
+    Totals per (name, kind, backend): calls, seconds, rows and bytes, slowest
+    first. Summing self_seconds over all rows gives the total without counting
+    nested calls twice.
+    """
+    df = events_frame(**tags)
+    if df.empty:
+        return df
+    df['backend'] = df['backend'].fillna('')
+    grouped = df.groupby(['name', 'kind', 'backend'])
+    result = grouped.agg(calls=('seconds', 'size'), seconds=('seconds', 'sum'), self_seconds=('self_seconds', 'sum'),
+                         max_seconds=('seconds', 'max'), rows=('rows', 'sum'), bytes=('bytes', 'sum'),
+                         peak_memory=('peak_memory', 'max'))
+    return result.sort_values('seconds', ascending=False).reset_index()
+
+
+def clear():
+    with _events_lock:
+        _events.clear()
+
+
+def _emit(event):
+    event.update(_tags.get())
+    with _events_lock:
+        _events.append(event)
+    for hook in list(_hooks):
+        try:
+            hook(event)
+        except Exception:
+            logger.exception("Instrumentation hook %r failed", hook)
+
+
+def _size(result):
+    # (rows, bytes) of a call's result where they mean something
+    if isinstance(result, pd.DataFrame):
+        return len(result), int(result.memory_usage(index=True, deep=False).sum())
+    if isinstance(result, pd.Series):
+        return len(result), int(result.memory_usage(index=True, deep=False))
+    if type(result).__module__.startswith('pyarrow') and hasattr(result, 'num_rows'):
+        return result.num_rows, result.nbytes
+    if isinstance(result, (list, dict)):
+        return len(result), None
+    return None, None
+
+
+def _stack():
+    if not hasattr(_local, 'stack'):
+        _local.stack = []
+    return _local.stack
+
+
+def _charge_parent(seconds):
+    # Time spent in a nested instrumented call is not the enclosing call's own time
+    stack = _stack()
+    if stack:
+        stack[-1].child_seconds += seconds
+
+
+class _Frame:
+    # One instrumented call in progress on this thread
+
+    def __init__(self):
+        self.start = time.perf_counter()
+        self.child_seconds = 0.0
+        self.base_memory = None
+        self.peak_memory = 0
+        if tracemalloc.is_tracing():
+            self.overlaps = _enter_memory_tracking()
+            current, peak = tracemalloc.get_traced_memory()
+            # Keep the enclosing call's peak before resetting it for this one
+            for outer in _stack():
+                outer.peak_memory = max(outer.peak_memory, peak)
+            tracemalloc.reset_peak()
+            self.base_memory = current
+
+    def finish(self):
+        seconds = time.perf_counter() - self.start
+        _charge_parent(seconds)
+        peak = None
+        if self.base_memory is not None:
+            # Another thread's calls reset and raise the shared peak, so it says nothing about this call
+            overlapped = _exit_memory_tracking() != self.overlaps
+            if tracemalloc.is_tracing() and not overlapped:
+                peak = max(self.peak_memory, tracemalloc.get_traced_memory()[1]) - self.base_memory
+                for outer in _stack():
+                    outer.peak_memory = max(outer.peak_memory, peak + self.base_memory)
+        return seconds, peak
+
+
+def _enter_memory_tracking():
+    # Returns the overlap counter as of this call's start, or None if another thread is busy already
+    global _memory_overlaps
+    thread = threading.get_ident()
+    with _memory_lock:
+        busy = any(t != thread for t in _memory_threads)
+        if busy:
+            _memory_overlaps += 1
+        _memory_threads[thread] = _memory_threads.get(thread, 0) + 1
+        return None if busy else _memory_overlaps
+
+
+def _exit_memory_tracking():
+    # Returns the overlap counter as of this call's end
+    thread = threading.get_ident()
+    with _memory_lock:
+        _memory_threads[thread] -= 1
+        if not _memory_threads[thread]:
+            del _memory_threads[thread]
+        return _memory_overlaps
+
+
+def instrumented(kind='query', backend=None):
+    """
+    Decorator recording one event per call. The backend and table are taken
+    from the call's `source` and `table_name` arguments (`backend` is used for
+    functions without a `source` argument). Generator functions are timed over
+    the whole iteration, counting only the time spent inside the generator (not
+    in the consumer), and their rows/bytes are summed over the yielded chunks.
+    """
+    def decorator(fn):
+        signature = inspect.signature(fn)
+        name = f"{fn.__module__.rsplit('.', 1)[-1]}.{fn.__name__}"
+
+        def describe(args, kwargs):
+            try:
+                bound = signature.bind(*args, **kwargs)
+                bound.apply_defaults()
+                arguments = bound.arguments
+            except TypeError:
+                arguments = {}
+            return {
+                'name': name,
+                'kind': kind,
+                'backend': arguments.get('source', backend),
+                'table': arguments.get('table_name'),
+                'started_at': time.time(),
+                'depth': len(_stack()),
+            }
+
+        def record(event, seconds, self_seconds, rows, size, peak, error):
+            event.update({'seconds': seconds, 'self_seconds': self_seconds, 'rows': rows, 'bytes': size,
+                          'peak_memory': peak, 'error': None if error is None else repr(error)})
+            _emit(event)
+
+        if inspect.isgeneratorfunction(fn):
+            @functools.wraps(fn)
+            def wrapper(*args, **kwargs):
+                event = describe(args, kwargs)
+                generator = fn(*args, **kwargs)
+                seconds, rows, size, error = 0.0, 0, 0, None
+                try:
+                    while True:
+                        start = time.perf_counter()
+                        try:
+                            item = next(generator)
+                        except StopIteration:
+                            break
+                        finally:
+                            elapsed = time.perf_counter() - start
+                            seconds += elapsed
+                            # The consumer's frame is on top while it pulls the next item
+                            _charge_parent(elapsed)
+                        item_rows, item_bytes = _size(item)
+                        rows += item_rows or 0
+                        size += item_bytes or 0
+                        yield item
+                except GeneratorExit:
+                    generator.close()
+                    raise
+                except Exception as e:
+                    error = e
+                    raise
+                finally:
+                    record(event, seconds, seconds, rows, size, None, error)
+            return wrapper
+
+        @functools.wraps(fn)
+        def wrapper(*args, **kwargs):
+            event = describe(args, kwargs)
+            stack = _stack()
+            frame = _Frame()
+            stack.append(frame)
+            result, error = None, None
+            try:
+                result = fn(*args, **kwargs)
+                return result
+            except Exception as e:
+                error = e
+                raise
+            finally:
+                stack.pop()
+                seconds, peak = frame.finish()
+                rows, size = _size(result)
+                record(event, seconds, seconds - frame.child_seconds, rows, size, peak, error)
+        return wrapper
+    return decorator
+
+
+add_hook(_log_hook)
+if os.environ.get("DQ_TRACE_MEMORY") == "1":
+    enable_memory_tracking()
@@ -0,0 +1,169 @@
+"""
+Partition-parallel profiling of a single large table.
+
+The table is split into primary-key ranges and every range is fetched and
+checked by a worker process with its own connection; the per-partition
+ChunkedChecks are merged into one result with the same shape as
+profiler.profile_table.
+"""
+import multiprocessing
+import os
+import threading
+from concurrent.futures import ProcessPoolExecutor
+from contextlib import contextmanager
+
+from scripts import data_fetcher, profiler, quality_checks
+
+_process_pool = None
+_process_pool_size = 0
+_process_pool_users = {}  # pool -> number of callers submitting to it
+_retired_pools = set()  # replaced pools, shut down once their last caller is done
+_process_pool_lock = threading.Lock()
+
+
+@contextmanager
+def process_pool(workers=None):
+    """
+    Yields the process-wide worker pool, creating a bigger one when more
+    workers are requested. A replaced pool is only shut down once every
+    caller still using it has left its `with` block, so nobody submits to a
+    pool that was shut down. Workers are spawned rather than forked, since
+    the parent holds database connections and threads (Streamlit, the
+    comparison executor).
+    """
+    global _process_pool, _process_pool_size
+    workers = workers or int(os.environ.get("DQ_PROFILE_PROCESSES", os.cpu_count() or 1))
+    retired = None
+    with _process_pool_lock:
+        if _process_pool is None or _process_pool_size < workers:
+            if _process_pool is not None:
+                if _process_pool in _process_pool_users:
+                    _retired_pools.add(_process_pool)
+                else:
+                    retired = _process_pool
+            _process_pool = ProcessPoolExecutor(max_workers=workers,
+                                                mp_context=multiprocessing.get_context('spawn'))
+            _process_pool_size = workers
+        pool = _process_pool
+        _process_pool_users[pool] = _process_pool_users.get(pool, 0) + 1
+    if retired is not None:
+        retired.shutdown(wait=False)
+    try:
+        yield pool
+    finally:
+        with _process_pool_lock:
+            _process_pool_users[pool] -= 1
+            done = _process_pool_users[pool] == 0
+            if done:
+                del _process_pool_users[pool]
+            retire = done and pool in _retired_pools
+            if retire:
+                _retired_pools.remove(pool)
+        if retire:
+            pool.shutdown(wait=False)
+
+
+def _database(conn, source):
+    # What a worker needs to open its own connection to the same database
+    if source == 'sqlite':
+        path = data_fetcher.connection_identity(conn, 'sqlite')[len("sqlite:"):]
+        if not path:
+            raise ValueError("Partitioned profiling needs a file-backed SQLite database.")
+        return path
+    elif source == 'snowflake':
+        return None
+    else:
+        raise ValueError("Unsupported source type.")
+
+
+def _connect(database, source):
+    if source == 'sqlite':
+        from config.sqlite_config import get_sqlite_connection
+        return get_sqlite_connection(database)
+    elif source == 'snowflake':
+        from config.snowflake_config import get_snowflake_connection
+        return get_snowflake_connection()
+    else:
+        raise ValueError("Unsupported source type.")
+
+
+def partition_filters(conn, table_name, key_column, partitions, source='sqlite'):
+    """
+    Splits the integer key range into `partitions` half-open ranges of equal
+    width and returns one WHERE clause per range. Rows with a NULL key go to
+    the first partition, so together the filters cover every row exactly once.
+    """
+    cur = conn.cursor()
+    cur.execute(f"SELECT MIN({key_column}), MAX({key_column}) FROM {table_name}")
+    lo, hi = cur.fetchone()
+    if lo is None or partitions <= 1:
+        return [None]
+    lo, hi = int(lo), int(hi)
+    width = max(1, -(-(hi - lo + 1) // partitions))
+    bounds = list(range(lo + width, hi + 1, width))
+    filters = []
+    for i in range(len(bounds) + 1):
+        conditions = []
+        if i > 0:
+            conditions.append(f"{key_column} >= {bounds[i - 1]}")
+        if i < len(bounds):
+            conditions.append(f"{key_column} < {bounds[i]}")
+        where = " AND ".join(conditions)
+        if i == 0:
+            where = f"({where} OR {key_column} IS NULL)"
+        filters.append(where)
+    return filters
+
+
+def check_partition(database, table_name, where, source='sqlite', chunksize=50000):
+    """
+    Worker entry point: opens its own connection and runs the chunked checks
+    over the rows matching `where`.
+    """
+    conn = _connect(database, source)
+    try:
+        chunks = data_fetcher.iter_table_chunks(conn, table_name, chunksize=chunksize, source=source, where=where)
+        return quality_checks.run_chunked_checks(chunks)
+    finally:
+        conn.close()
+
+
+def profile_table_partitioned(conn, table_name, source='sqlite', partitions=None, key_column=None,
+                              chunksize=50000):
+    """
+    Profiles a table with `partitions` worker processes (default: one per
+    core), each checking one primary-key range.
+
+    Returns a dict like profiler.profile_table: 'row_count', 'nulls',
+    'duplicates' and 'stats'. Counts, duplicates, minima and maxima equal
+    those of a serial chunked run; means and standard deviations can differ
+    in the last bits because floating-point sums are added in another order.
+    """
+    partitions = partitions or int(os.environ.get("DQ_PROFILE_PROCESSES", os.cpu_count() or 1))
+    database = _database(conn, source)
+    key_column = key_column or data_fetcher.get_primary_key(conn, table_name, source=source)
+    filters = partition_filters(conn, table_name, key_column, partitions, source=source)
+
+    checks = quality_checks.ChunkedChecks()
+    with process_pool(partitions) as pool:
+        futures = [pool.submit(check_partition, database, table_name, where, source, chunksize) for where in filters]
+        for future in futures:
+            checks.merge(future.result())
+
+    return {
+        'row_count': checks.row_count,
+        'nulls': checks.nulls(),
+        'duplicates': checks.duplicates(),
+        'stats': checks.stats(),
+    }
+
+
+def profile_table(conn, table_name, source='sqlite', partitions=None):
+    """
+    Profiles SQLite tables partition-parallel, since SQLite runs the pushdown
+    profile on one core. Snowflake already parallelizes profiler.profile_table
+    inside the warehouse, so it keeps using that.
+    """
+    if source == 'snowflake':
+        return profiler.profile_table(conn, table_name, source=source)
+    return profile_table_partitioned(conn, table_name, source=source, partitions=partitions)
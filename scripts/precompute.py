@@ -0,0 +1,222 @@
+"""
+Background precomputation of the checks of every common table.
+
+A scheduler thread re-runs the batch checks (scripts.batch_runner) on an
+interval, on its own connection pools and worker threads, and writes the
+report to a local JSON snapshot. app.py reads the snapshot, so opening the
+dashboard does not wait on the warehouse.
+
+    python -m scripts.precompute --interval 600
+
+runs the scheduler on its own; by default app.py starts one in its process
+(DQ_PRECOMPUTE=0 turns that off).
+"""
+import argparse
+import json
+import logging
+import os
+import sys
+import tempfile
+import threading
+import time
+
+from config import connection_pool
+from scripts import batch_runner, data_fetcher, results_store
+
+DEFAULT_SNAPSHOT_PATH = os.path.join(os.path.dirname(__file__), "..", "data", "dq_snapshot.json")
+
+logger = logging.getLogger('dq.precompute')
+
+
+def write_snapshot(snapshot, path=DEFAULT_SNAPSHOT_PATH):
+    """
+    Writes the snapshot to a temporary file next to `path` and renames it into
+    place, so readers see either the old or the new snapshot, never half of one.
+    """
+    directory = os.path.dirname(os.path.abspath(path))
+    os.makedirs(directory, exist_ok=True)
+    fd, tmp_path = tempfile.mkstemp(dir=directory, prefix='.dq_snapshot.', suffix='.tmp')
+    try:
+        with os.fdopen(fd, 'w') as f:
+            json.dump(snapshot, f, default=int)
+        os.replace(tmp_path, path)
+    except BaseException:
+        os.unlink(tmp_path)
+        raise
+
+
+def read_snapshot(path=DEFAULT_SNAPSHOT_PATH):
+    # None until the first snapshot has been written
+    try:
+        with open(path) as f:
+            return json.load(f)
+    except FileNotFoundError:
+        return None
+
+
+def snapshot_age(snapshot):
+    return time.time() - snapshot['generated_at']
+
+
+def compute_snapshot(source_side, target_side, schema='', store=None, **options):
+    """
+    Checks every common table (unchanged tables reuse their stored result, see
+    batch_runner.run_changed_tables) and returns the snapshot dict. Without a
+    `schema` a Snowflake target is read from its connection's schema.
+    """
+    start = time.time()
+    store = store or results_store.ResultsStore()
+    if not schema and target_side[1] == 'snowflake':
+        # No schema given: use the one the Snowflake connection is configured with
+        with connection_pool.get_pool(target_side[0]).connection() as conn:
+            schema = data_fetcher.get_current_schema(conn)
+    sides = {}
+    for name, side in (('source', source_side), ('target', target_side)):
+        side_schema = schema if side[1] == 'snowflake' else ''
+        with connection_pool.get_pool(side[0]).connection() as conn:
+            sides[name] = {
+                'source_type': side[1],
+                'tables': sorted(data_fetcher.get_all_table_schemas(conn, source=side[1], schema=side_schema)),
+                'row_counts': data_fetcher.get_all_row_counts(conn, source=side[1], schema=side_schema),
+                'versions': data_fetcher.get_table_versions(conn, source=side[1], schema=side_schema),
+            }
+    tables = sorted(set(sides['source']['tables']) & set(sides['target']['tables']))
+    results = batch_runner.run_changed_tables(tables, source_side, target_side, store, schema=schema,
+                                              versions=(sides['source']['versions'], sides['target']['versions']),
+                                              **options)
+    return {
+        'generated_at': time.time(),
+        'seconds': round(time.time() - start, 3),
+        'schema': schema,
+        'source': sides['source'],
+        'target': sides['target'],
+        'tables': {row['table']: row for row in results},
+    }
+
+
+def is_fresh(snapshot, schema=None, max_age=None):
+    """
+    Whether the app can serve table lists, row counts and versions from the
+    snapshot instead of querying: it exists, is younger than `max_age`
+    seconds (DQ_SNAPSHOT_MAX_AGE, default 30 minutes) and, when `schema` is
+    given, was taken for that Snowflake schema.
+    """
+    max_age = float(os.environ.get("DQ_SNAPSHOT_MAX_AGE", 1800)) if max_age is None else max_age
+    if not snapshot or 'target' not in snapshot or snapshot_age(snapshot) > max_age:
+        return False
+    if schema is None or snapshot['target']['source_type'] != 'snowflake':
+        return True
+    return snapshot['schema'].upper() == schema.upper()
+
+
+class Scheduler:
+    """
+    Recomputes the snapshot every `interval` seconds on a daemon thread.
+    trigger() starts a recompute right away instead of waiting for the interval.
+    Tables are checked on batch_runner's thread pool (`concurrency` threads)
+    with connections from pools named 'precompute-...', so the scheduler never
+    takes threads or connections from the dashboard's executor.
+    """
+
+    def __init__(self, interval=900, path=DEFAULT_SNAPSHOT_PATH, schema='', target_db=None, concurrency=2,
+                 **options):
+        self.interval = interval
+        self.path = path
+        self.schema = schema
+        self.target_db = target_db
+        self.concurrency = concurrency
+        self.options = options
+        self.running = False
+        self.last_error = None
+        self._wake = threading.Event()
+        self._stop = threading.Event()
+        self._thread = None
+
+    def start(self):
+        if self._thread is None:
+            self._thread = threading.Thread(target=self._loop, name='dq-precompute', daemon=True)
+            self._thread.start()
+        return self
+
+    def stop(self, wait=True):
+        self._stop.set()
+        self._wake.set()
+        if wait and self._thread is not None:
+            self._thread.join()
+
+    def trigger(self):
+        self._wake.set()
+
+    def run_once(self):
+        self.running = True
+        try:
+            source_side, target_side = batch_runner.resolve_sides(self.target_db, self.concurrency, prefix='precompute-')
+            snapshot = compute_snapshot(source_side, target_side, schema=self.schema,
+                                        concurrency=self.concurrency, **self.options)
+            write_snapshot(snapshot, self.path)
+            self.last_error = None
+            return snapshot
+        except Exception as e:
+            # Keep the previous snapshot and try again on the next round
+            self.last_error = f"{type(e).__name__}: {e}"
+            logger.exception("Precompute failed")
+        finally:
+            self.running = False
+
+    def _loop(self):
+        while not self._stop.is_set():
+            self._wake.clear()
+            self.run_once()
+            self._wake.wait(self.interval)
+
+
+_scheduler = None
+_scheduler_lock = threading.Lock()
+
+
+def get_scheduler():
+    """
+    Returns the process-wide scheduler, started on first use, so every
+    Streamlit session shares one. Configured from DQ_PRECOMPUTE_INTERVAL
+    (seconds), DQ_PRECOMPUTE_SCHEMA (default: the Snowflake connection's
+    schema) and DQ_PRECOMPUTE_CONCURRENCY.
+    """
+    global _scheduler
+    with _scheduler_lock:
+        if _scheduler is None:
+            _scheduler = Scheduler(
+                interval=float(os.environ.get("DQ_PRECOMPUTE_INTERVAL", 900)),
+                schema=os.environ.get("DQ_PRECOMPUTE_SCHEMA", ''),
+                concurrency=int(os.environ.get("DQ_PRECOMPUTE_CONCURRENCY", 2)),
+            ).start()
+        return _scheduler
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Keep the dashboard snapshot of every common table up to date.")
+    parser.add_argument('--interval', type=float, default=900, help="Seconds between recomputes")
+    parser.add_argument('--once', action='store_true', help="Compute one snapshot and exit")
+    parser.add_argument('--snapshot', default=DEFAULT_SNAPSHOT_PATH, help="Snapshot path")
+    parser.add_argument('--schema', default='', help="Snowflake schema holding the target tables (default: the connection's schema)")
+    parser.add_argument('--target-db', help="Use this SQLite file as the target instead of Snowflake")
+    parser.add_argument('--concurrency', type=int, default=2)
+    parser.add_argument('--fingerprints', action='store_true',
+                        help="Also compare per-column fingerprints (one more scan per side)")
+    args = parser.parse_args(argv)
+
+    logging.basicConfig()
+    scheduler = Scheduler(interval=args.interval, path=args.snapshot, schema=args.schema, target_db=args.target_db,
+                          concurrency=args.concurrency, fingerprints=args.fingerprints)
+    if args.once:
+        return 0 if scheduler.run_once() else 2
+    scheduler.start()
+    try:
+        while True:
+            time.sleep(3600)
+    except KeyboardInterrupt:
+        scheduler.stop(wait=False)
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -0,0 +1,100 @@
+import math
+
+import pandas as pd
+
+from scripts import data_fetcher
+
+NUMERIC_TYPES = ('INT', 'REAL', 'FLOA', 'DOUB', 'NUM', 'DEC', 'FIXED')
+
+
+def is_numeric_type(data_type):
+    # Matches SQLite type affinities as well as Snowflake's NUMBER/FLOAT family
+    data_type = (data_type or '').upper()
+    return any(t in data_type for t in NUMERIC_TYPES)
+
+
+def as_float(column, source):
+    if source == 'sqlite':
+        return f"CAST({column} AS REAL)"
+    elif source == 'snowflake':
+        return f"{column}::FLOAT"
+    else:
+        raise ValueError("Unsupported source type.")
+
+
+def _row_expression(columns, source):
+    # Expression that is equal for two rows exactly when every column is equal (NULLs included)
+    if source == 'sqlite':
+        return " || '|' || ".join(f"quote({c})" for c in columns)
+    elif source == 'snowflake':
+        return f"HASH({', '.join(columns)})"
+    else:
+        raise ValueError("Unsupported source type.")
+
+
+def build_profile_query(table_name, column_types, source='sqlite'):
+    """
+    Builds one aggregate query returning, in this order: the row count, the null
+    count of every column, count/min/max/avg/avg-of-squares of every numeric
+    column and the number of duplicate rows.
+    """
+    columns = [name for name, _ in column_types]
+    numeric = [name for name, data_type in column_types if is_numeric_type(data_type)]
+
+    select = ["COUNT(*)"]
+    select += [f"COUNT(*) - COUNT({c})" for c in columns]
+    for c in numeric:
+        value = as_float(c, source)
+        select += [f"COUNT({c})", f"MIN({value})", f"MAX({value})",
+                   f"AVG({value})", f"AVG({value} * {value})"]
+    select.append(f"COUNT(*) - COUNT(DISTINCT {_row_expression(columns, source)})")
+    return f"SELECT {', '.join(select)} FROM {table_name}"
+
+
+def profile_table(conn, table_name, source='sqlite'):
+    """
+    Profiles a whole table with a single scan in the database.
+
+    Returns a dict with 'row_count', 'nulls' (percentage per column, like
+    quality_checks.check_nulls), 'duplicates' (like check_duplicates) and
+    'stats' (count/mean/std/min/max per numeric column, like basic_stats).
+    """
+    column_types = data_fetcher.get_column_types(conn, table_name, source=source)
+    columns = [name for name, _ in column_types]
+    numeric = [name for name, data_type in column_types if is_numeric_type(data_type)]
+
+    cur = conn.cursor()
+    cur.execute(build_profile_query(table_name, column_types, source=source))
+    row = list(cur.fetchone())
+
+    row_count = int(row.pop(0))
+    null_counts = [int(row.pop(0)) for _ in columns]
+    nulls = pd.Series(
+        [n / row_count * 100 if row_count else float('nan') for n in null_counts],
+        index=columns, dtype='float64'
+    )
+
+    stats = {}
+    for c in numeric:
+        count, minimum, maximum, mean, mean_sq = row[:5]
+        del row[:5]
+        count = int(count)
+        std = float('nan')
+        if count > 1:
+            variance = (float(mean_sq) - float(mean) ** 2) * count / (count - 1)
+            std = math.sqrt(max(variance, 0.0))
+        stats[c] = {
+            'count': float(count),
+            'mean': float(mean) if mean is not None else float('nan'),
+            'std': std,
+            'min': float(minimum) if minimum is not None else float('nan'),
+            'max': float(maximum) if maximum is not None else float('nan'),
+        }
+    duplicates = int(row.pop(0))
+
+    return {
+        'row_count': row_count,
+        'nulls': nulls,
+        'duplicates': duplicates,
+        'stats': pd.DataFrame(stats, index=['count', 'mean', 'std', 'min', 'max']),
+    }
@@ -1,15 +1,219 @@
+import numpy as np
 import pandas as pd
 
+from scripts.instrumentation import instrumented
+
+def _is_arrow(data):
+    return type(data).__module__.startswith('pyarrow')
+
+def _as_frame(data):
+    # Arrow tables and record batches become DataFrames with Arrow-backed columns
+    if _is_arrow(data):
+        return data.to_pandas(types_mapper=pd.ArrowDtype)
+    return data
+
+@instrumented('compute')
 def check_nulls(df):
     # Returns percentage of nulls per column
+    if _is_arrow(df):
+        # Arrow keeps a null count per column, no need to scan the values
+        return pd.Series({
+            name: (column.null_count / df.num_rows * 100) if df.num_rows else np.nan
+            for name, column in zip(df.schema.names, df.columns)
+        }, dtype='float64')
     nulls = df.isnull().mean() * 100
     return nulls
 
+@instrumented('compute')
 def check_duplicates(df):
     # Returns count of duplicate rows
-    dup_count = df.duplicated().sum()
+    dup_count = _as_frame(df).duplicated().sum()
     return dup_count
 
+@instrumented('compute')
 def basic_stats(df):
     # Returns basic statistics for numeric columns
-    return df.describe()
+    return _as_frame(df).describe()
+
+
+# Bumped whenever _row_hashes changes, so stored hashes are not mixed with new ones
+ROW_HASH_VERSION = 2
+# Hash of a NULL cell, whatever the column's dtype
+NULL_HASH = np.uint64(0x9E3779B97F4A7C15)
+
+
+def _row_hashes(df):
+    # 64-bit hash per row. Numeric columns are cast to float so that a column
+    # read as int in one chunk and float (because of NULLs) in the next hashes
+    # the same, and every NULL hashes to NULL_HASH, so an all-NULL column read
+    # as object (None) in one chunk matches the NaNs of a float column in the next.
+    cells = {}
+    for i, column in enumerate(df.columns):
+        series = df.iloc[:, i]
+        if pd.api.types.is_numeric_dtype(series) and not pd.api.types.is_bool_dtype(series):
+            series = series.astype('float64')
+        hashes = pd.util.hash_pandas_object(series, index=False).to_numpy(dtype=np.uint64, copy=True)
+        hashes[series.isna().to_numpy()] = NULL_HASH
+        cells[i] = hashes
+    return pd.util.hash_pandas_object(pd.DataFrame(cells, index=range(len(df))), index=False).to_numpy(dtype=np.uint64)
+
+
+class ChunkedChecks:
+    """
+    Accumulates null, duplicate and basic statistics over a stream of DataFrame
+    chunks. Between chunks only per-column counters and a sorted array of
+    distinct 64-bit row hashes (8 bytes per distinct row), plus the hashes of
+    recent chunks not yet merged into it, are kept; the rows themselves never
+    outlive their chunk.
+    """
+
+    # Distinct hashes of new chunks wait as sorted runs and are merged into
+    # row_hashes once they hold as many hashes as it does (and at least this
+    # many), so every hash is copied O(log n) times rather than once per chunk
+    MERGE_MIN_HASHES = 1 << 20
+
+    def __init__(self):
+        self.row_count = 0
+        self.null_counts = pd.Series(dtype='int64')
+        self._duplicate_count = 0
+        self._row_hashes = np.empty(0, dtype=np.uint64)
+        self._pending = []
+        self._pending_size = 0
+        self.numeric = pd.DataFrame(index=['count', 'sum', 'sum_sq', 'min', 'max'], dtype='float64')
+
+    @property
+    def row_hashes(self):
+        # Sorted distinct hashes of every row seen so far
+        self._merge_pending()
+        return self._row_hashes
+
+    @row_hashes.setter
+    def row_hashes(self, hashes):
+        self._row_hashes, self._pending, self._pending_size = hashes, [], 0
+
+    @property
+    def duplicate_count(self):
+        self._merge_pending()
+        return self._duplicate_count
+
+    @duplicate_count.setter
+    def duplicate_count(self, count):
+        self._merge_pending()
+        self._duplicate_count = count
+
+    def update(self, chunk):
+        chunk = _as_frame(chunk)
+        self.row_count += len(chunk)
+        if self.null_counts.empty:
+            self.null_counts = chunk.isnull().sum()
+        else:
+            self.null_counts = self.null_counts.add(chunk.isnull().sum(), fill_value=0).astype('int64')
+        self._update_duplicates(_row_hashes(chunk))
+        self._update_numeric(chunk.select_dtypes(include='number'))
+        return self
+
+    def _update_duplicates(self, hashes):
+        unique = np.unique(hashes)
+        self._duplicate_count += len(hashes) - len(unique)
+        self._pending.append(unique)
+        self._pending_size += len(unique)
+        if self._pending_size >= max(len(self._row_hashes), self.MERGE_MIN_HASHES):
+            self._merge_pending()
+
+    def _merge_pending(self):
+        # Every run is distinct, so each repeat of a hash across runs is one more duplicate row
+        if not self._pending:
+            return
+        # A stable sort merges the already sorted runs in about linear time
+        merged = np.sort(np.concatenate([self._row_hashes] + self._pending), kind='stable')
+        distinct = np.ones(len(merged), dtype=bool)
+        distinct[1:] = merged[1:] != merged[:-1]
+        self._duplicate_count += len(merged) - int(distinct.sum())
+        self._row_hashes = merged[distinct]
+        self._pending, self._pending_size = [], 0
+
+    def _update_numeric(self, numeric):
+        numeric = numeric.astype('float64')
+        self._merge_numeric(pd.DataFrame({
+            'count': numeric.count(),
+            'sum': numeric.sum(),
+            'sum_sq': (numeric * numeric).sum(),
+            'min': numeric.min(),
+            'max': numeric.max(),
+        }).T)
+
+    def _merge_numeric(self, current):
+        if current.empty:
+            return
+        if self.numeric.empty:
+            self.numeric = current
+            return
+        merged = self.numeric.add(current, fill_value=0)
+        merged.loc['min'] = pd.concat([self.numeric.loc['min'], current.loc['min']], axis=1).min(axis=1)
+        merged.loc['max'] = pd.concat([self.numeric.loc['max'], current.loc['max']], axis=1).max(axis=1)
+        self.numeric = merged
+
+    def merge(self, other):
+        """
+        Folds in the checks of another part of the same table (e.g. a key-range
+        partition checked in another process). Rows seen in both parts count
+        as duplicates, so merging gives the same result as one pass over both.
+        """
+        self.row_count += other.row_count
+        if self.null_counts.empty:
+            self.null_counts = other.null_counts.copy()
+        elif not other.null_counts.empty:
+            self.null_counts = self.null_counts.add(other.null_counts, fill_value=0).astype('int64')
+        self._duplicate_count += other.duplicate_count
+        # other.row_hashes is already sorted and distinct, so only overlaps are counted
+        self._update_duplicates(other.row_hashes)
+        self._merge_numeric(other.numeric)
+        return self
+
+    def nulls(self):
+        # Same shape as check_nulls
+        if not self.row_count:
+            return self.null_counts.astype('float64') * np.nan
+        return self.null_counts / self.row_count * 100
+
+    def duplicates(self):
+        # Same shape as check_duplicates
+        return self.duplicate_count
+
+    def stats(self):
+        # count/mean/std/min/max per numeric column, like basic_stats without quantiles
+        n = self.numeric.loc['count']
+        mean = self.numeric.loc['sum'] / n
+        variance = (self.numeric.loc['sum_sq'] - n * mean * mean) / (n - 1)
+        return pd.DataFrame({
+            'count': n,
+            'mean': mean,
+            'std': np.sqrt(variance.clip(lower=0)).where(n > 1),
+            'min': self.numeric.loc['min'],
+            'max': self.numeric.loc['max'],
+        }).T
+
+
+@instrumented('compute')
+def run_chunked_checks(chunks):
+    """
+    Runs the null, duplicate and stats checks in one pass over an iterator of
+    DataFrame chunks or Arrow batches, e.g. data_fetcher.iter_table_chunks(...)
+    or data_fetcher.iter_arrow_batches(...).
+    """
+    checks = ChunkedChecks()
+    for chunk in chunks:
+        checks.update(chunk)
+    return checks
+
+
+@instrumented('compute')
+def check_nulls_chunked(chunks):
+    # Returns percentage of nulls per column over all chunks
+    return run_chunked_checks(chunks).nulls()
+
+
+@instrumented('compute')
+def check_duplicates_chunked(chunks):
+    # Returns count of duplicate rows over all chunks
+    return run_chunked_checks(chunks).duplicates()
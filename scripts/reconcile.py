@@ -0,0 +1,210 @@
+"""
+Key reconciliation: which keys exist on one side but not the other, and
+which foreign keys point at missing parents.
+
+Within one database the check is pushed down as an anti-join, so only counts
+and a few sample keys come back. Across databases (source vs target) each
+side streams its distinct keys in sorted order and the two streams are
+merge-joined in Python a chunk at a time, so memory stays at a couple of
+chunks however many keys the tables hold.
+"""
+import numpy as np
+import pandas as pd
+
+from scripts import data_fetcher
+from scripts.instrumentation import instrumented
+
+
+@instrumented()
+def iter_sorted_keys(conn, table_name, key_column, source='sqlite', chunksize=100000):
+    """
+    Yields the distinct non-NULL values of a column in ascending order, as
+    numpy arrays of at most `chunksize` keys. The database sorts (through an
+    index when there is one) and rows are fetched chunk by chunk from one
+    cursor. Both SQLite and Snowflake order text by its UTF-8 bytes unless a
+    collation is set, which is the order Python compares strings in.
+    """
+    if source not in ('sqlite', 'snowflake'):
+        raise ValueError("Unsupported source type.")
+    cur = conn.cursor()
+    cur.execute(f"SELECT DISTINCT {key_column} FROM {table_name} "
+                f"WHERE {key_column} IS NOT NULL ORDER BY {key_column}")
+    while True:
+        rows = cur.fetchmany(chunksize)
+        if not rows:
+            break
+        yield np.array([row[0] for row in rows])
+
+
+def _split_through(keys, bound):
+    # (keys <= bound, keys > bound) of a sorted array; a None bound takes everything
+    if bound is None:
+        return keys, keys[:0]
+    i = np.searchsorted(keys, bound, side='right')
+    return keys[:i], keys[i:]
+
+
+@instrumented('compute')
+def compare_key_streams(left, right, sample_size=20):
+    """
+    Merge-joins two iterators of sorted, distinct key arrays.
+
+    Keys up to the smaller of the two buffered maxima are complete on both
+    sides, so they are compared (vectorized) and dropped, and the side that
+    ran out is refilled. Returns the number of keys on each side, the number
+    only on the left / only on the right and up to `sample_size` of each.
+    """
+    left, right = iter(left), iter(right)
+    empty = np.array([])
+    streams = [[left, empty, False], [right, empty, False]]  # iterator, buffer, exhausted
+    totals = [0, 0]
+    only = [0, 0]
+    samples = [[], []]
+
+    while True:
+        for stream in streams:
+            if not len(stream[1]) and not stream[2]:
+                chunk = next(stream[0], None)
+                if chunk is None:
+                    stream[2] = True
+                else:
+                    stream[1] = chunk
+        if all(done and not len(buffer) for _, buffer, done in streams):
+            break
+        open_maxima = [buffer[-1] for _, buffer, done in streams if not done]
+        bound = min(open_maxima) if open_maxima else None
+
+        parts = []
+        for stream in streams:
+            part, stream[1] = _split_through(stream[1], bound)
+            parts.append(part)
+        for i, (mine, theirs) in enumerate((parts, parts[::-1])):
+            totals[i] += len(mine)
+            missing = np.setdiff1d(mine, theirs, assume_unique=True) if len(theirs) else mine
+            only[i] += len(missing)
+            if len(samples[i]) < sample_size:
+                samples[i].extend(missing[:sample_size - len(samples[i])].tolist())
+
+    return {
+        'left_keys': totals[0],
+        'right_keys': totals[1],
+        'left_only': only[0],
+        'right_only': only[1],
+        'left_only_sample': samples[0],
+        'right_only_sample': samples[1],
+    }
+
+
+def reconcile_keys(conn_source, conn_target, table_name, key_column=None,
+                   source='sqlite', target='snowflake', chunksize=100000, sample_size=20):
+    """
+    Finds the keys of a table that are in the source but missing from the
+    target, and the other way round, by streaming both sorted key columns.
+
+    Returns a dict with the distinct key counts, 'missing_in_target' and
+    'extra_in_target' counts and a sample of each.
+    """
+    key_column = key_column or data_fetcher.get_primary_key(conn_source, table_name, source=source)
+    result = compare_key_streams(
+        iter_sorted_keys(conn_source, table_name, key_column, source=source, chunksize=chunksize),
+        iter_sorted_keys(conn_target, table_name, key_column, source=target, chunksize=chunksize),
+        sample_size=sample_size,
+    )
+    return {
+        'key_column': key_column,
+        'source_keys': result['left_keys'],
+        'target_keys': result['right_keys'],
+        'missing_in_target': result['left_only'],
+        'extra_in_target': result['right_only'],
+        'missing_in_target_sample': result['left_only_sample'],
+        'extra_in_target_sample': result['right_only_sample'],
+    }
+
+
+@instrumented()
+def get_foreign_keys(conn, source='sqlite', schema=''):
+    """
+    Returns the declared foreign keys as a list of dicts with 'table',
+    'column', 'ref_table' and 'ref_column'. Snowflake does not enforce foreign
+    keys and often has none declared; the source's list can be used there.
+    """
+    foreign_keys = []
+    if source == 'sqlite':
+        cur = conn.cursor()
+        for table_name in data_fetcher.get_table_list(conn, source=source):
+            cur.execute(f"PRAGMA foreign_key_list({table_name})")
+            for row in cur.fetchall():
+                # (id, seq, parent table, child column, parent column, ...); no parent column means its primary key
+                ref_column = row[4] or data_fetcher.get_primary_key(conn, row[2], source=source)
+                foreign_keys.append({'table': table_name, 'column': row[3], 'ref_table': row[2], 'ref_column': ref_column})
+    elif source == 'snowflake':
+        cur = conn.cursor()
+        cur.execute(f"SHOW IMPORTED KEYS IN SCHEMA {schema}" if schema else "SHOW IMPORTED KEYS")
+        names = [d[0].lower() for d in cur.description]
+        for row in cur.fetchall():
+            row = dict(zip(names, row))
+            foreign_keys.append({'table': row['fk_table_name'], 'column': row['fk_column_name'],
+                                 'ref_table': row['pk_table_name'], 'ref_column': row['pk_column_name']})
+    else:
+        raise ValueError("Unsupported source type.")
+    return foreign_keys
+
+
+@instrumented()
+def orphan_check(conn, table_name, column, ref_table, ref_column, source='sqlite', sample_size=20):
+    """
+    Counts the rows (and distinct values) of table_name.column that have no
+    matching ref_table.ref_column, with an anti-join run in the database.
+    NULL references are not orphans. Returns a dict with 'orphan_rows',
+    'orphan_keys' and up to `sample_size` orphan keys.
+    """
+    if source not in ('sqlite', 'snowflake'):
+        raise ValueError("Unsupported source type.")
+    where = (f"c.{column} IS NOT NULL AND NOT EXISTS "
+             f"(SELECT 1 FROM {ref_table} p WHERE p.{ref_column} = c.{column})")
+    cur = conn.cursor()
+    cur.execute(f"SELECT COUNT(*), COUNT(DISTINCT c.{column}) FROM {table_name} c WHERE {where}")
+    orphan_rows, orphan_keys = (int(v or 0) for v in cur.fetchone())
+    sample = []
+    if orphan_rows:
+        cur.execute(f"SELECT DISTINCT c.{column} FROM {table_name} c WHERE {where} "
+                    f"ORDER BY c.{column} LIMIT {int(sample_size)}")
+        sample = [row[0] for row in cur.fetchall()]
+    return {'orphan_rows': orphan_rows, 'orphan_keys': orphan_keys, 'sample': sample}
+
+
+def orphan_check_streamed(conn_child, conn_parent, table_name, column, ref_table, ref_column,
+                          child_source='sqlite', parent_source='sqlite', chunksize=100000, sample_size=20):
+    """
+    Like orphan_check, for a child and parent table in different databases:
+    both key columns are streamed sorted and merge-joined. Only distinct
+    orphan keys are counted, so 'orphan_rows' is None.
+    """
+    result = compare_key_streams(
+        iter_sorted_keys(conn_child, table_name, column, source=child_source, chunksize=chunksize),
+        iter_sorted_keys(conn_parent, ref_table, ref_column, source=parent_source, chunksize=chunksize),
+        sample_size=sample_size,
+    )
+    return {'orphan_rows': None, 'orphan_keys': result['left_only'], 'sample': result['left_only_sample']}
+
+
+def check_foreign_keys(conn, source='sqlite', schema='', foreign_keys=None, table_name=None, sample_size=20):
+    """
+    Runs orphan_check for every foreign key (by default those declared in
+    this database), optionally only those whose child or parent is
+    `table_name`. Returns a DataFrame with one row per foreign key.
+    """
+    foreign_keys = get_foreign_keys(conn, source=source, schema=schema) if foreign_keys is None else foreign_keys
+    if table_name:
+        foreign_keys = [fk for fk in foreign_keys
+                        if table_name.lower() in (fk['table'].lower(), fk['ref_table'].lower())]
+    rows = []
+    for fk in foreign_keys:
+        result = orphan_check(conn, fk['table'], fk['column'], fk['ref_table'], fk['ref_column'],
+                              source=source, sample_size=sample_size)
+        rows.append({
+            'foreign_key': f"{fk['table']}.{fk['column']} -> {fk['ref_table']}.{fk['ref_column']}",
+            **result,
+            'status': 'fail' if result['orphan_rows'] else 'pass',
+        })
+    return pd.DataFrame(rows, columns=['foreign_key', 'orphan_rows', 'orphan_keys', 'sample', 'status'])
@@ -0,0 +1,31 @@
+import os
+
+from scripts import data_fetcher
+
+# Check results (profiles, samples, fingerprints) keyed by database, table,
+# table version and check. A new table version simply misses the cache, so
+# entries only need a TTL to bound how long unused results stay in memory.
+check_cache = data_fetcher.MetadataCache(
+    ttl=float(os.environ.get("DQ_CHECK_CACHE_TTL", 3600)),
+    maxsize=int(os.environ.get("DQ_CHECK_CACHE_SIZE", 128)),
+)
+
+
+def cached_check(conn, check, fn, table_name, *args, source='sqlite', version=None, **kwargs):
+    """
+    Returns fn(conn, table_name, *args, source=source, **kwargs), reusing an
+    earlier result for the same database, table, `version` (see
+    data_fetcher.get_table_versions), check name and arguments.
+    Without a version the data may have changed unnoticed, so nothing is cached.
+    """
+    if version is None:
+        return fn(conn, table_name, *args, source=source, **kwargs)
+    key = (
+        data_fetcher.connection_identity(conn, source),
+        table_name.lower(),
+        version,
+        check,
+        args,
+        tuple(sorted(kwargs.items())),
+    )
+    return check_cache.get_or_load(key, lambda: fn(conn, table_name, *args, source=source, **kwargs))
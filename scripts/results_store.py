@@ -0,0 +1,189 @@
+import json
+import os
+import sqlite3
+import time
+import uuid
+
+import pandas as pd
+
+DEFAULT_RESULTS_PATH = os.path.join(os.path.dirname(__file__), "..", "data", "check_results.sqlite")
+
+
+class ResultsStore:
+    """
+    Local history of check results, one row per (run, table, check), indexed by
+    (table, check, time) so trend queries read a narrow index range.
+    """
+
+    def __init__(self, path=DEFAULT_RESULTS_PATH):
+        self.path = path
+        with self._connect() as conn:
+            conn.execute("PRAGMA journal_mode=WAL")
+            conn.execute("""
+            CREATE TABLE IF NOT EXISTS check_results (
+                run_id TEXT NOT NULL,
+                table_name TEXT NOT NULL,
+                check_name TEXT NOT NULL,
+                checked_at REAL NOT NULL,
+                status TEXT NOT NULL,
+                value REAL,
+                detail TEXT
+            );
+            """)
+            conn.execute("""
+            CREATE INDEX IF NOT EXISTS idx_results_table_check_time
+            ON check_results (table_name, check_name, checked_at);
+            """)
+            conn.execute("""
+            CREATE TABLE IF NOT EXISTS last_checks (
+                table_name TEXT NOT NULL,
+                mode TEXT NOT NULL,
+                source_version TEXT NOT NULL,
+                target_version TEXT NOT NULL,
+                checked_at REAL NOT NULL,
+                report TEXT NOT NULL,
+                PRIMARY KEY (table_name, mode)
+            );
+            """)
+
+    def _connect(self):
+        return sqlite3.connect(self.path, timeout=30)
+
+    def record(self, rows):
+        """
+        Bulk-inserts result rows, each a dict with run_id, table_name, check_name,
+        checked_at (epoch seconds), status, value and detail, in one transaction.
+        """
+        with self._connect() as conn:
+            conn.executemany("""
+            INSERT INTO check_results (run_id, table_name, check_name, checked_at, status, value, detail)
+            VALUES (:run_id, :table_name, :check_name, :checked_at, :status, :value, :detail)
+            """, rows)
+        return len(rows)
+
+    def trend(self, table_name, check_name=None, since=None, until=None):
+        """
+        Returns the results of one table (optionally one check) between two
+        epoch timestamps as a DataFrame ordered by time.
+        """
+        query = "SELECT run_id, table_name, check_name, checked_at, status, value, detail " \
+                "FROM check_results WHERE table_name = ?"
+        params = [table_name.lower()]
+        if check_name is not None:
+            query += " AND check_name = ?"
+            params.append(check_name)
+        if since is not None:
+            query += " AND checked_at >= ?"
+            params.append(since)
+        if until is not None:
+            query += " AND checked_at <= ?"
+            params.append(until)
+        query += " ORDER BY checked_at"
+        with self._connect() as conn:
+            df = pd.read_sql_query(query, conn, params=params)
+        df['checked_at'] = pd.to_datetime(df['checked_at'], unit='s')
+        return df
+
+    def last_checks(self, mode):
+        """
+        Returns {table name: {'source_version', 'target_version', 'checked_at',
+        'report'}} of the latest check of every table run in `mode`.
+        """
+        with self._connect() as conn:
+            rows = conn.execute(
+                "SELECT table_name, source_version, target_version, checked_at, report "
+                "FROM last_checks WHERE mode = ?", (mode,)
+            ).fetchall()
+        return {
+            table_name: {'source_version': source_version, 'target_version': target_version,
+                         'checked_at': checked_at, 'report': json.loads(report)}
+            for table_name, source_version, target_version, checked_at, report in rows
+        }
+
+    def save_last_checks(self, mode, checks):
+        """
+        Replaces the latest check of each table; `checks` holds dicts with
+        table_name, source_version, target_version, checked_at and the report row.
+        """
+        with self._connect() as conn:
+            conn.executemany("""
+            INSERT OR REPLACE INTO last_checks (table_name, mode, source_version, target_version, checked_at, report)
+            VALUES (?, ?, ?, ?, ?, ?)
+            """, [(c['table_name'].lower(), mode, c['source_version'], c['target_version'], c['checked_at'],
+                   json.dumps(c['report'], default=int)) for c in checks])
+        return len(checks)
+
+    def tables(self):
+        with self._connect() as conn:
+            return [r[0] for r in conn.execute("SELECT DISTINCT table_name FROM check_results ORDER BY 1")]
+
+    def compact(self, keep_days=30, retention_days=365):
+        """
+        Deletes results older than `retention_days` and, for results older than
+        `keep_days`, keeps only the last result per table, check and day.
+        Returns the number of deleted rows; the file is only vacuumed when
+        there were any.
+        """
+        now = time.time()
+        with self._connect() as conn:
+            deleted = conn.execute("DELETE FROM check_results WHERE checked_at < ?",
+                                   (now - retention_days * 86400,)).rowcount
+            deleted += conn.execute("""
+            DELETE FROM check_results
+            WHERE checked_at < ?
+              AND rowid NOT IN (
+                SELECT rowid FROM (
+                    SELECT rowid, ROW_NUMBER() OVER (
+                        PARTITION BY table_name, check_name, CAST(checked_at / 86400 AS INTEGER)
+                        ORDER BY checked_at DESC
+                    ) AS rn
+                    FROM check_results
+                    WHERE checked_at < ?
+                ) WHERE rn = 1
+              )
+            """, (now - keep_days * 86400, now - keep_days * 86400)).rowcount
+        if deleted:
+            conn = self._connect()
+            try:
+                conn.execute("VACUUM")
+            finally:
+                conn.close()
+        return deleted
+
+
+def rows_from_report(results, run_id=None, checked_at=None):
+    """
+    Flattens batch_runner report rows into one result row per table and check.
+    The value is the target-minus-source difference (or number of differing
+    columns) so a trend line at zero means no drift.
+    """
+    run_id = run_id or uuid.uuid4().hex
+    checked_at = checked_at or time.time()
+    rows = []
+
+    def add(table, check, status, value, detail=None):
+        rows.append({
+            'run_id': run_id, 'table_name': table.lower(), 'check_name': check,
+            'checked_at': checked_at, 'status': status, 'value': value,
+            'detail': json.dumps(detail, default=int) if detail is not None else None,
+        })
+
+    for r in results:
+        if r['status'] in ('error', 'timeout'):
+            add(r['table'], 'table', r['status'], None, {'error': r['error']})
+            continue
+        failed = set(r['failed_checks'])
+        status = lambda check: 'fail' if check in failed else 'pass'
+        add(r['table'], 'row_count', status('row_count'), r['row_count_target'] - r['row_count_source'],
+            {'source': r['row_count_source'], 'target': r['row_count_target']})
+        add(r['table'], 'schema', status('schema'),
+            len(r['columns_missing_in_target']) + len(r['columns_extra_in_target']),
+            {'missing': r['columns_missing_in_target'], 'extra': r['columns_extra_in_target']})
+        add(r['table'], 'nulls', status('nulls'), len(r['null_mismatch_columns']),
+            {'columns': r['null_mismatch_columns']})
+        add(r['table'], 'duplicates', status('duplicates'), r['duplicates_target'] - r['duplicates_source'],
+            {'source': r['duplicates_source'], 'target': r['duplicates_target']})
+        if 'drifted_columns' in r:
+            add(r['table'], 'fingerprint', status('fingerprint'), len(r['drifted_columns']),
+                {'columns': r['drifted_columns']})
+    return rows
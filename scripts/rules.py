@@ -0,0 +1,288 @@
+"""
+Declarative column rules, evaluated with one scan per table.
+
+Rules live in config/validation_rules.json (or a YAML file with the same
+layout), keyed by table name:
+
+    {"loans": [
+        {"name": "loan_amount_positive", "type": "range", "column": "LoanAmount", "min": 0, "exclusive_min": true},
+        {"name": "end_after_start", "type": "expression", "columns": ["StartDate", "EndDate"],
+         "condition": "EndDate > StartDate"}
+    ]}
+
+Rule types: not_null, range (min/max, optionally exclusive_min/exclusive_max),
+allowed_values (values), regex (pattern, matched against the whole value) and
+expression (a condition every row must satisfy, listing the columns it uses).
+Except for not_null, a NULL value never violates a rule. Expression
+conditions should stick to comparisons, arithmetic, AND/OR/NOT and string
+literals so they mean the same in SQLite, Snowflake and pandas.
+"""
+import json
+import os
+import re
+
+import pandas as pd
+
+from scripts import data_fetcher, profiler
+from scripts.instrumentation import instrumented
+
+DEFAULT_RULES_PATH = os.path.join(os.path.dirname(__file__), "..", "config", "validation_rules.json")
+RULE_TYPES = ('not_null', 'range', 'allowed_values', 'regex', 'expression')
+
+
+def load_rules(path=DEFAULT_RULES_PATH):
+    """
+    Returns {table name (lower case): [rule, ...]} from a JSON or YAML rule file.
+    Every rule gets a name if it has none.
+    """
+    with open(path) as f:
+        if path.lower().endswith(('.yaml', '.yml')):
+            # Optional dependency, only needed for YAML rule files
+            import yaml
+            spec = yaml.safe_load(f)
+        else:
+            spec = json.load(f)
+    rules = {}
+    for table_name, table_rules in (spec or {}).items():
+        for rule in table_rules:
+            if rule.get('type') not in RULE_TYPES:
+                raise ValueError(f"Unsupported rule type: {rule.get('type')}")
+            rule.setdefault('name', f"{rule.get('column', 'expression')}_{rule['type']}".lower())
+        rules[table_name.lower()] = table_rules
+    return rules
+
+
+def rule_columns(rule):
+    # Columns a rule reads
+    return rule.get('columns', []) if rule['type'] == 'expression' else [rule['column']]
+
+
+def _regexp(pattern, value):
+    if value is None:
+        return None
+    return re.fullmatch(pattern, str(value)) is not None
+
+
+def prepare_connection(conn, source='sqlite'):
+    """
+    Registers the dq_regexp function SQLite needs for regex rules. Snowflake
+    has REGEXP_LIKE built in, so nothing is registered there.
+    """
+    if source == 'sqlite':
+        conn.create_function("dq_regexp", 2, _regexp, deterministic=True)
+    return conn
+
+
+def _literal(value):
+    if isinstance(value, str):
+        return "'" + value.replace("'", "''") + "'"
+    return repr(value)
+
+
+def violation_predicate(rule, source='sqlite'):
+    """
+    Returns a SQL condition that is true for the rows violating a rule.
+    """
+    kind = rule['type']
+    column = rule.get('column')
+    if kind == 'not_null':
+        return f"{column} IS NULL"
+    if kind == 'range':
+        value = profiler.as_float(column, source)
+        conditions = []
+        if rule.get('min') is not None:
+            conditions.append(f"{value} {'<=' if rule.get('exclusive_min') else '<'} {float(rule['min'])}")
+        if rule.get('max') is not None:
+            conditions.append(f"{value} {'>=' if rule.get('exclusive_max') else '>'} {float(rule['max'])}")
+        return " OR ".join(conditions) or "1 = 0"
+    if kind == 'allowed_values':
+        return f"{column} NOT IN ({', '.join(_literal(v) for v in rule['values'])})"
+    if kind == 'regex':
+        if source == 'sqlite':
+            return f"NOT dq_regexp({_literal(rule['pattern'])}, {column})"
+        elif source == 'snowflake':
+            # Dollar quoting keeps backslashes in the pattern as they are; REGEXP_LIKE matches the whole value
+            return f"NOT REGEXP_LIKE({column}, $${rule['pattern']}$$)"
+        else:
+            raise ValueError("Unsupported source type.")
+    if kind == 'expression':
+        # Rows with a NULL in any of the rule's columns are skipped, as for the other rule types
+        present = "".join(f" AND {c} IS NOT NULL" for c in rule.get('columns', []))
+        return f"NOT ({rule['condition']}){present}"
+    raise ValueError(f"Unsupported rule type: {kind}")
+
+
+def build_rules_query(table_name, rules, source='sqlite'):
+    """
+    Builds one aggregate query returning the row count followed by the
+    violation count of every rule.
+    """
+    select = ["COUNT(*)"]
+    select += [f"SUM(CASE WHEN {violation_predicate(rule, source)} THEN 1 ELSE 0 END)" for rule in rules]
+    return f"SELECT {', '.join(select)} FROM {table_name}"
+
+
+def _split_missing(rules, columns):
+    # Rules whose columns all exist, and the rest with the first missing column
+    existing = {c.lower() for c in columns}
+    runnable, missing = [], {}
+    for rule in rules:
+        absent = [c for c in rule_columns(rule) if c.lower() not in existing]
+        if absent:
+            missing[rule['name']] = absent[0]
+        else:
+            runnable.append(rule)
+    return runnable, missing
+
+
+def _report(rules, row_count, violations, missing, failing_keys=None):
+    rows = {}
+    for rule in rules:
+        name = rule['name']
+        count = violations.get(name)
+        if name in missing:
+            status = f"missing column {missing[name]}"
+        else:
+            status = 'fail' if count else 'pass'
+        rows[name] = {
+            'type': rule['type'],
+            'column': rule.get('column', ', '.join(rule.get('columns', []))),
+            'violations': count if name not in missing else None,
+            'violation_pct': (count / row_count * 100 if row_count else 0.0) if name not in missing else None,
+            'status': status,
+        }
+        if failing_keys is not None:
+            rows[name]['failing_keys'] = failing_keys.get(name, [])
+    columns = ['type', 'column', 'violations', 'violation_pct', 'status']
+    if failing_keys is not None:
+        columns.append('failing_keys')
+    return pd.DataFrame.from_dict(rows, orient='index', columns=columns)
+
+
+@instrumented()
+def run_rules(conn, table_name, rules, source='sqlite', sample_keys=0, key_column=None):
+    """
+    Evaluates all rules of a table in the database with a single scan.
+
+    Returns a DataFrame indexed by rule name with the violation count and
+    percentage and a status (pass, fail or 'missing column ...'). With
+    `sample_keys`, up to that many failing primary keys are fetched per
+    violated rule (one extra, LIMITed query per violated rule).
+    """
+    prepare_connection(conn, source=source)
+    columns = data_fetcher.get_column_names(conn, table_name, source=source)
+    runnable, missing = _split_missing(rules, columns)
+
+    row_count, violations = 0, {}
+    if runnable:
+        cur = conn.cursor()
+        cur.execute(build_rules_query(table_name, runnable, source=source))
+        row = cur.fetchone()
+        row_count = int(row[0])
+        violations = {rule['name']: int(count or 0) for rule, count in zip(runnable, row[1:])}
+    else:
+        row_count = data_fetcher.get_table_row_count(conn, table_name, source=source)
+
+    failing_keys = None
+    if sample_keys:
+        key_column = key_column or data_fetcher.get_primary_key(conn, table_name, source=source)
+        failing_keys = {}
+        cur = conn.cursor()
+        for rule in runnable:
+            if violations[rule['name']]:
+                cur.execute(f"SELECT {key_column} FROM {table_name} WHERE {violation_predicate(rule, source)} "
+                            f"ORDER BY {key_column} LIMIT {int(sample_keys)}")
+                failing_keys[rule['name']] = [r[0] for r in cur.fetchall()]
+    return _report(rules, row_count, violations, missing, failing_keys)
+
+
+def _pandas_condition(condition, columns):
+    # Rewrites a portable SQL condition for DataFrame.eval, leaving string literals alone
+    by_name = {c.lower(): c for c in columns}
+    parts = re.split(r"('(?:[^']|'')*')", condition)
+    for i in range(0, len(parts), 2):
+        part = re.sub(r"<>", "!=", parts[i])
+        part = re.sub(r"(?<![<>!=])=(?!=)", "==", part)
+        part = re.sub(r"\b(AND|OR|NOT)\b", lambda m: m.group(1).lower(), part, flags=re.IGNORECASE)
+        part = re.sub(r"\b[A-Za-z_][A-Za-z0-9_]*\b",
+                      lambda m: f"`{by_name[m.group(0).lower()]}`" if m.group(0).lower() in by_name else m.group(0),
+                      part)
+        parts[i] = part
+    return "".join(parts)
+
+
+def violation_mask(chunk, rule):
+    """
+    Returns a boolean Series marking the rows of a DataFrame that violate a rule,
+    with the same NULL semantics as violation_predicate.
+    """
+    by_name = {c.lower(): c for c in chunk.columns}
+    kind = rule['type']
+    if kind == 'expression':
+        columns = [by_name[c.lower()] for c in rule.get('columns', [])]
+        result = chunk.eval(_pandas_condition(rule['condition'], chunk.columns), engine='python')
+        return ~result.fillna(False).astype(bool) & chunk[columns].notna().all(axis=1)
+
+    values = chunk[by_name[rule['column'].lower()]]
+    if kind == 'not_null':
+        return values.isna()
+    present = values.notna()
+    if kind == 'range':
+        numbers = pd.to_numeric(values, errors='coerce')
+        mask = pd.Series(False, index=chunk.index)
+        if rule.get('min') is not None:
+            mask |= numbers <= rule['min'] if rule.get('exclusive_min') else numbers < rule['min']
+        if rule.get('max') is not None:
+            mask |= numbers >= rule['max'] if rule.get('exclusive_max') else numbers > rule['max']
+        return mask & present
+    if kind == 'allowed_values':
+        return ~values.isin(rule['values']) & present
+    if kind == 'regex':
+        return ~values.astype(str).str.fullmatch(rule['pattern']).fillna(False).astype(bool) & present
+    raise ValueError(f"Unsupported rule type: {kind}")
+
+
+@instrumented('compute')
+def run_rules_chunked(chunks, rules, sample_keys=0, key_column=None):
+    """
+    Evaluates all rules in one vectorized pass over an iterator of DataFrame
+    chunks (e.g. data_fetcher.iter_table_chunks(...)), for when the rules
+    should not run in the database. Returns the same DataFrame as run_rules;
+    failing keys are taken from `key_column`, in chunk order.
+    """
+    row_count, violations, failing_keys, missing = 0, {}, {}, None
+    runnable = []
+    for chunk in chunks:
+        if missing is None:
+            runnable, missing = _split_missing(rules, chunk.columns)
+            violations = {rule['name']: 0 for rule in runnable}
+            failing_keys = {rule['name']: [] for rule in runnable}
+            if sample_keys:
+                key_column = {c.lower(): c for c in chunk.columns}[key_column.lower()]
+        row_count += len(chunk)
+        for rule in runnable:
+            mask = violation_mask(chunk, rule)
+            violations[rule['name']] += int(mask.sum())
+            keys = failing_keys[rule['name']]
+            if sample_keys and len(keys) < sample_keys:
+                keys.extend(chunk.loc[mask, key_column].head(sample_keys - len(keys)).tolist())
+    return _report(rules, row_count, violations, missing or {}, failing_keys if sample_keys else None)
+
+
+def validate_table(conn, table_name, source='sqlite', rules=None, mode='sql', sample_keys=0, chunksize=50000):
+    """
+    Runs the configured rules of one table, in the database (mode='sql') or
+    over streamed chunks (mode='chunks'). Returns None if the table has no rules.
+    """
+    rules = load_rules() if rules is None else rules
+    table_rules = rules.get(table_name.lower())
+    if not table_rules:
+        return None
+    key_column = data_fetcher.get_primary_key(conn, table_name, source=source) if sample_keys else None
+    if mode == 'sql':
+        return run_rules(conn, table_name, table_rules, source=source, sample_keys=sample_keys, key_column=key_column)
+    elif mode == 'chunks':
+        chunks = data_fetcher.iter_table_chunks(conn, table_name, chunksize=chunksize, source=source)
+        return run_rules_chunked(chunks, table_rules, sample_keys=sample_keys, key_column=key_column)
+    else:
+        raise ValueError("Unsupported rule mode.")
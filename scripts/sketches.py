@@ -0,0 +1,289 @@
+import math
+
+import numpy as np
+import pandas as pd
+
+from scripts import data_fetcher, profiler
+
+# Snowflake documents an average relative error of 1.62338% for APPROX_COUNT_DISTINCT
+SNOWFLAKE_DISTINCT_ERROR = 0.0162338
+
+
+def _value_hashes(values):
+    # 64-bit hashes of the non-null values, with numbers hashed as floats so that
+    # int and float columns (which pandas uses once NULLs appear) agree
+    values = pd.Series(values).dropna()
+    if pd.api.types.is_numeric_dtype(values) and not pd.api.types.is_bool_dtype(values):
+        values = values.astype('float64')
+    return pd.util.hash_pandas_object(values, index=False).to_numpy(dtype=np.uint64)
+
+
+class HyperLogLog:
+    """
+    HyperLogLog distinct counter with 2**precision one-byte registers.
+    Two sketches built with the same precision merge by taking the register-wise
+    maximum, which gives the sketch of the union of their inputs.
+    """
+
+    def __init__(self, precision=12):
+        self.precision = precision
+        self.registers = np.zeros(1 << precision, dtype=np.uint8)
+
+    def update(self, values):
+        hashes = _value_hashes(values)
+        if not len(hashes):
+            return self
+        p = self.precision
+        index = (hashes >> np.uint64(64 - p)).astype(np.int64)
+        rest = hashes & np.uint64((1 << (64 - p)) - 1)
+        # Rank = position of the leftmost 1-bit in the remaining 64 - p bits
+        bit_length = np.frexp(rest.astype(np.float64))[1]
+        rank = (64 - p - bit_length + 1).astype(np.uint8)
+        np.maximum.at(self.registers, index, rank)
+        return self
+
+    def merge(self, other):
+        if other.precision != self.precision:
+            raise ValueError("Cannot merge HyperLogLog sketches of different precision.")
+        np.maximum(self.registers, other.registers, out=self.registers)
+        return self
+
+    def estimate(self):
+        m = len(self.registers)
+        alpha = 0.7213 / (1 + 1.079 / m)
+        raw = alpha * m * m / np.sum(np.power(2.0, -self.registers.astype(np.float64)))
+        zeros = int(np.count_nonzero(self.registers == 0))
+        if raw <= 2.5 * m and zeros:
+            # Linear counting is more accurate for small cardinalities
+            return m * math.log(m / zeros)
+        return float(raw)
+
+    def relative_error(self):
+        # Standard error of the estimate
+        return 1.04 / math.sqrt(len(self.registers))
+
+
+class KLLSketch:
+    """
+    KLL quantile sketch. Values are kept in a stack of compactors, level h holding
+    items of weight 2**h; a full compactor sorts itself and promotes every other
+    item to the next level. Merging concatenates levels and compacts again.
+    """
+
+    def __init__(self, k=200, seed=None):
+        self.k = k
+        self.n = 0
+        self.compactors = [np.empty(0)]
+        self._rng = np.random.default_rng(seed)
+
+    def _capacity(self, level):
+        depth = len(self.compactors) - 1 - level
+        return max(2, int(math.ceil(self.k * (2 / 3) ** depth)))
+
+    def update(self, values):
+        values = pd.to_numeric(pd.Series(values), errors='coerce').dropna().to_numpy(dtype=np.float64)
+        if len(values):
+            self.n += len(values)
+            self.compactors[0] = np.concatenate([self.compactors[0], values])
+            self._compress()
+        return self
+
+    def merge(self, other):
+        for level, items in enumerate(other.compactors):
+            if level == len(self.compactors):
+                self.compactors.append(np.empty(0))
+            self.compactors[level] = np.concatenate([self.compactors[level], items])
+        self.n += other.n
+        self._compress()
+        return self
+
+    def _compress(self):
+        level = 0
+        while level < len(self.compactors):
+            items = self.compactors[level]
+            if len(items) <= self._capacity(level):
+                level += 1
+                continue
+            if level + 1 == len(self.compactors):
+                self.compactors.append(np.empty(0))
+            items = np.sort(items)
+            # An odd item out stays at this level
+            keep = items[-1:] if len(items) % 2 else items[:0]
+            paired = items[:len(items) - len(keep)]
+            promoted = paired[self._rng.integers(2)::2]
+            self.compactors[level] = keep
+            self.compactors[level + 1] = np.concatenate([self.compactors[level + 1], promoted])
+            # Capacities depend on the number of levels, so start over
+            level = 0
+
+    def quantile(self, q):
+        values = np.concatenate(self.compactors)
+        if not len(values):
+            return float('nan')
+        weights = np.concatenate([np.full(len(c), 2.0 ** h) for h, c in enumerate(self.compactors)])
+        order = np.argsort(values, kind='stable')
+        cumulative = np.cumsum(weights[order])
+        position = np.searchsorted(cumulative, q * cumulative[-1], side='left')
+        return float(values[order][min(position, len(values) - 1)])
+
+    def rank(self, value):
+        """
+        Returns the estimated fractions of values below and at or below `value`;
+        for a value with many ties, every rank between the two is consistent.
+        """
+        values = np.concatenate(self.compactors)
+        if not len(values):
+            return float('nan'), float('nan')
+        weights = np.concatenate([np.full(len(c), 2.0 ** h) for h, c in enumerate(self.compactors)])
+        total = weights.sum()
+        return float(weights[values < value].sum() / total), float(weights[values <= value].sum() / total)
+
+    def rank_error(self):
+        # Approximate normalized rank error (99% confidence) for a KLL sketch of size k
+        return 2.296 / self.k ** 0.9723
+
+
+class TableSketch:
+    """
+    Per-column HyperLogLog and (for numeric columns) KLL sketches of a table,
+    built from streamed chunks. Sketches of partitions or of successive
+    incremental runs merge into the sketch of the whole table.
+    """
+
+    def __init__(self, precision=12, k=200):
+        self.precision = precision
+        self.k = k
+        self.row_count = 0
+        self.distinct = {}
+        self.quantiles = {}
+
+    def update(self, chunk):
+        self.row_count += len(chunk)
+        for column in chunk.columns:
+            self.distinct.setdefault(column, HyperLogLog(self.precision)).update(chunk[column])
+            series = chunk[column]
+            if pd.api.types.is_numeric_dtype(series) and not pd.api.types.is_bool_dtype(series):
+                self.quantiles.setdefault(column, KLLSketch(self.k)).update(series)
+        return self
+
+    def merge(self, other):
+        self.row_count += other.row_count
+        for column, sketch in other.distinct.items():
+            self.distinct.setdefault(column, HyperLogLog(self.precision)).merge(sketch)
+        for column, sketch in other.quantiles.items():
+            self.quantiles.setdefault(column, KLLSketch(self.k)).merge(sketch)
+        return self
+
+    def to_frame(self, quantiles=(0.25, 0.5, 0.75)):
+        rows = {}
+        for column, hll in self.distinct.items():
+            row = {'approx_distinct': hll.estimate(), 'distinct_error': hll.relative_error()}
+            kll = self.quantiles.get(column)
+            for q in quantiles:
+                row[f"q{q:g}"] = kll.quantile(q) if kll else float('nan')
+            row['rank_error'] = kll.rank_error() if kll else float('nan')
+            rows[column] = row
+        return pd.DataFrame.from_dict(rows, orient='index')
+
+
+def _snowflake_approximate_profile(conn, table_name, quantiles):
+    column_types = data_fetcher.get_column_types(conn, table_name, source='snowflake')
+    select = []
+    for name, data_type in column_types:
+        select.append(f"APPROX_COUNT_DISTINCT({name})")
+        if profiler.is_numeric_type(data_type):
+            select += [f"APPROX_PERCENTILE({name}, {q})" for q in quantiles]
+        else:
+            select += ["NULL"] * len(quantiles)
+    cur = conn.cursor()
+    cur.execute(f"SELECT {', '.join(select)} FROM {table_name}")
+    row = list(cur.fetchone())
+
+    rows = {}
+    width = 1 + len(quantiles)
+    for i, (name, data_type) in enumerate(column_types):
+        values = row[i * width:(i + 1) * width]
+        result = {'approx_distinct': float(values[0]), 'distinct_error': SNOWFLAKE_DISTINCT_ERROR}
+        for q, value in zip(quantiles, values[1:]):
+            result[f"q{q:g}"] = float(value) if value is not None else float('nan')
+        # APPROX_PERCENTILE is t-digest based and has no documented fixed bound
+        result['rank_error'] = float('nan')
+        rows[name] = result
+    return pd.DataFrame.from_dict(rows, orient='index')
+
+
+def approximate_profile(conn, table_name, source='sqlite', quantiles=(0.25, 0.5, 0.75), chunksize=100000):
+    """
+    Approximate distinct counts and quantiles per column, with error bounds.
+
+    Snowflake computes them in-database with APPROX_COUNT_DISTINCT and
+    APPROX_PERCENTILE. SQLite has no such functions, so the table is streamed
+    in chunks into a TableSketch.
+
+    Returns (profile DataFrame, TableSketch or None). The sketch can be merged
+    with sketches of other partitions or later runs.
+    """
+    if source == 'snowflake':
+        return _snowflake_approximate_profile(conn, table_name, quantiles), None
+    elif source == 'sqlite':
+        sketch = TableSketch()
+        for chunk in data_fetcher.iter_table_chunks(conn, table_name, chunksize=chunksize, source=source):
+            sketch.update(chunk)
+        return sketch.to_frame(quantiles), sketch
+    else:
+        raise ValueError("Unsupported source type.")
+
+
+def _rank_gap(q, value, quantile_points, kll=None):
+    """
+    How far rank q (of `value` on one side) lies outside the rank interval
+    the other side gives `value`. The interval comes from the other side's
+    KLL sketch when there is one, otherwise it is bracketed by its quantile
+    points, e.g. a value above the other side's median has rank >= 0.5 there.
+    """
+    if kll is not None:
+        low, high = kll.rank(value)
+    else:
+        low = max([p for p, v in quantile_points if v < value], default=0.0)
+        high = min([p for p, v in quantile_points if v > value], default=1.0)
+    return max(0.0, low - q, q - high)
+
+
+def compare_distributions(profile_source, profile_target, quantile_tolerance=0.01,
+                          sketch_source=None, sketch_target=None):
+    """
+    Flags columns whose distinct count differs by more than both sides' error
+    bounds allow, or whose quantiles drift in rank space: each side's
+    quantile values are looked up in the other side's distribution and
+    flagged when their rank there is off by more than `quantile_tolerance`
+    plus both sides' rank errors. Pass the TableSketches (approximate_profile's
+    second result) for sketch ranks; without one, the other side's quantile
+    points bound them.
+    """
+    source = profile_source.rename(index=str.upper)
+    target = profile_target.rename(index=str.upper)
+    source_sketches = {c.upper(): kll for c, kll in (sketch_source.quantiles if sketch_source else {}).items()}
+    target_sketches = {c.upper(): kll for c, kll in (sketch_target.quantiles if sketch_target else {}).items()}
+    quantile_columns = [c for c in source.columns if c.startswith('q') and c in target.columns]
+    rows = {}
+    for column in source.index.intersection(target.index):
+        s, t = source.loc[column], target.loc[column]
+        allowed = 3 * (s['distinct_error'] * s['approx_distinct'] + t['distinct_error'] * t['approx_distinct'])
+        distinct_drift = abs(s['approx_distinct'] - t['approx_distinct']) > allowed
+
+        # APPROX_PERCENTILE has no documented rank error, which counts as 0 here
+        rank_allowed = quantile_tolerance + np.nan_to_num(s['rank_error']) + np.nan_to_num(t['rank_error'])
+        gaps = []
+        for this, other, other_sketches in ((s, t, target_sketches), (t, s, source_sketches)):
+            points = [(float(q[1:]), other[q]) for q in quantile_columns if not math.isnan(other[q])]
+            gaps += [_rank_gap(float(q[1:]), this[q], points, other_sketches.get(column))
+                     for q in quantile_columns if not math.isnan(this[q])]
+        rank_gap = max(gaps, default=0.0)
+        rows[column] = {
+            'distinct_source': s['approx_distinct'],
+            'distinct_target': t['approx_distinct'],
+            'distinct_drift': bool(distinct_drift),
+            'quantile_rank_gap': rank_gap,
+            'quantile_drift': bool(rank_gap > rank_allowed),
+        }
+    return pd.DataFrame.from_dict(rows, orient='index')
@@ -0,0 +1,14 @@
+import pandas as pd
+
+from scripts import comparator
+
+
+def test_diff_frames_reports_duplicated_rows():
+    source = pd.DataFrame({'id': [1, 2, 3], 'amount': [10.0, 20.0, 30.0]})
+    target = pd.DataFrame({'id': [1, 2, 2, 3, 3], 'amount': [10.0, 20.0, 20.0, 30.0, 31.0]})
+
+    diff = comparator.diff_frames(source, target, 'id')
+
+    assert diff['added'] == [2, 3]
+    assert diff['deleted'] == []
+    assert diff['changed'] == []
@@ -0,0 +1,19 @@
+import sqlite3
+
+import pytest
+
+from config import connection_pool
+
+
+def test_connection_discarded_after_error():
+    pool = connection_pool.ConnectionPool(lambda: sqlite3.connect(":memory:"), max_size=1)
+    with pytest.raises(RuntimeError):
+        with pool.connection() as conn:
+            conn.execute("BEGIN")
+            raise RuntimeError("query failed")
+
+    assert pool.stats()['size'] == 0
+    with pool.connection() as new_conn:
+        assert new_conn is not conn
+        assert not new_conn.in_transaction
+    assert pool.stats()['idle'] == 1
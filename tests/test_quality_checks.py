@@ -0,0 +1,21 @@
+import pandas as pd
+
+from scripts import quality_checks
+
+
+def test_duplicates_across_chunks_with_all_null_column():
+    # x is all NULL (object dtype) in the first chunk and float64 in the second
+    checks = quality_checks.ChunkedChecks()
+    checks.update(pd.DataFrame({'id': [1, 2], 'x': [None, None]}))
+    checks.update(pd.DataFrame({'id': [1, 3], 'x': [None, 1.5]}))
+
+    assert checks.duplicates() == 1
+
+
+def test_merged_partitions_count_duplicates_across_them():
+    left, right = quality_checks.ChunkedChecks(), quality_checks.ChunkedChecks()
+    left.update(pd.DataFrame({'id': [1, 2], 'x': [None, None]}))
+    right.update(pd.DataFrame({'id': [1, 1, 3], 'x': [None, None, 1.5]}))
+    left.merge(right)
+
+    assert left.duplicates() == 2
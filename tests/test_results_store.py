@@ -0,0 +1,29 @@
+import time
+
+from scripts import results_store
+
+
+def _row(table_name, check_name, checked_at, run_id='run'):
+    return {'run_id': run_id, 'table_name': table_name, 'check_name': check_name, 'checked_at': checked_at,
+            'status': 'pass', 'value': 0.0, 'detail': None}
+
+
+def test_compact_prunes_old_results(tmp_path):
+    store = results_store.ResultsStore(str(tmp_path / "results.sqlite"))
+    now = time.time()
+    day = 86400
+    # Midday of a day 40 days ago, so both runs fall on the same day
+    old_day = (int(now // day) - 40) * day + day / 2
+    store.record([
+        _row('loans', 'row_count', now - 400 * day),   # past retention
+        _row('loans', 'row_count', old_day),           # older than keep_days, superseded the same day
+        _row('loans', 'row_count', old_day + 60),      # older than keep_days, last of its day
+        _row('loans', 'row_count', now - day),         # recent
+        _row('loans', 'row_count', now - day + 60),    # recent
+    ])
+
+    assert store.compact(keep_days=30, retention_days=365) == 2
+
+    kept = store.trend('loans')['checked_at'].astype('int64') // 10**9
+    assert sorted(kept) == [int(old_day + 60), int(now - day), int(now - day + 60)]
+    assert store.compact(keep_days=30, retention_days=365) == 0